@@ -0,0 +1,446 @@
+"""Sample the MCS8a TDC in a separate process.
+
+The DLL calls to the TDC block and hold the GIL. If they run in the GUI process, a
+slow or hung DLL freezes the GUI and the regulation loop with it. Here, a child
+process samples the TDC and publishes snapshots of the status, the settings, and
+the spectrum in a shared memory buffer. The parent maps this buffer directly and
+detects a stalled sampler by the age of the heartbeat that the child writes after
+every sample.
+
+Snapshots are protected by a sequence counter: the child makes it odd before
+writing and even again afterwards, the parent retries reading while the counter is
+odd or has changed during the read.
+"""
+
+import ctypes
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import queue
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from datatypes import AcqSettings, AcqStatus, BOARDSETTING
+from mcs8a import BIN_WIDTH, FakeMCS8aComm, MCS8aComm, settings_commands
+from metrics import DLL_LATENCY
+
+
+class SharedSnapshot(ctypes.Structure):
+    """Header of the shared memory buffer, followed by the spectrum (uint32)."""
+
+    _fields_ = [
+        ("sequence", ctypes.c_uint64),
+        ("heartbeat", ctypes.c_double),  # time.monotonic() of the last sample
+        ("active_channel", ctypes.c_int32),  # written by the parent
+        ("spectrum_requested", ctypes.c_int32),  # written by the parent
+        ("num_bins", ctypes.c_uint32),
+        ("error", ctypes.c_int32),  # number of consecutive failed samples
+        ("duration", ctypes.c_double),  # time the DLL calls of the sample took (s)
+        ("status_time", ctypes.c_double),  # time.monotonic() the status was read
+        ("status", AcqStatus),
+        ("settings", AcqSettings),
+        ("board", BOARDSETTING),
+    ]
+
+
+def sampler(
+    shm_name: str,
+    dllpath: str,
+    interval: float,
+    max_bins: int,
+    commands: mp.Queue,
+) -> None:
+    """Sample the TDC and publish the snapshots, runs in the child process.
+
+    :param shm_name: Name of the shared memory buffer.
+    :param dllpath: Path to the DLL, ``None`` for a fake TDC.
+    :param interval: Time between two samples in seconds.
+    :param max_bins: Maximum number of spectrum bins the buffer can hold.
+    :param commands: Queue of commands from the parent. A dictionary is applied as
+        settings, ``"refresh"`` refreshes the settings, ``None`` stops the sampler.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    snapshot = SharedSnapshot.from_buffer(shm.buf)
+    spectrum = np.ndarray(
+        (max_bins,),
+        dtype=np.uint32,
+        buffer=shm.buf,
+        offset=ctypes.sizeof(SharedSnapshot),
+    )
+
+    tdc = FakeMCS8aComm() if dllpath is None else MCS8aComm(dllpath=dllpath)
+    errors = 0
+
+    try:
+        while True:
+            try:
+                while True:
+                    command = commands.get_nowait()
+                    if command is None:
+                        return
+                    elif command == "refresh":
+                        tdc.refresh_settings()
+                    else:
+                        tdc.apply_settings(**command)
+            except queue.Empty:
+                pass
+
+            tdc.active_channel = snapshot.active_channel
+            tic = time.perf_counter()
+            try:
+                tdc.is_measuring  # updates the status
+                data = tdc.spectrum if snapshot.spectrum_requested else None
+                error = False
+            except Exception:
+                data = None
+                error = True
+            errors = errors + 1 if error else 0
+            duration = time.perf_counter() - tic
+
+            snapshot.sequence += 1  # odd: writing
+            snapshot.error = errors
+            snapshot.duration = duration
+            if not error:
+                snapshot.status = tdc.acquisition_status
+                snapshot.status_time = tdc.status_time
+                snapshot.settings = tdc.acquisition_settings
+                snapshot.board = tdc.board_settings
+                if data is not None:
+                    num_bins = min(data.shape[0], max_bins)
+                    spectrum[:num_bins] = data[:num_bins]
+                    snapshot.num_bins = num_bins
+            snapshot.sequence += 1  # even: done
+            snapshot.heartbeat = time.monotonic()
+
+            time.sleep(interval)
+    finally:
+        del snapshot, spectrum
+        shm.close()
+
+
+class ProcessMCS8aComm:
+    """MCS8a TDC that is sampled in a separate process.
+
+    Provides the same interface as ``MCS8aComm``. All reads return the latest
+    snapshot of the sampler and never call the DLL, thus they cannot block.
+    If the sampler is stalled, the TDC is reported as not measuring.
+    """
+
+    startup_timeout = 10.0  # time the sampler may take for its first sample (s)
+    max_errors = 5  # consecutive failed samples until the sampler counts as stalled
+
+    def __init__(
+        self,
+        dllpath: str = None,
+        interval: float = 0.05,
+        timeout: float = 2.0,
+        max_bins: int = 2**22,
+    ):
+        """Initialize the shared memory and start the sampler process.
+
+        :param dllpath: Path to the MCS8a DLL, ``None`` to use a fake TDC.
+        :param interval: Time between two samples in seconds.
+        :param timeout: Time after which the sampler is considered stalled (s).
+        :param max_bins: Maximum number of spectrum bins that can be shared.
+        """
+        self.dllpath = dllpath
+        self.interval = interval
+        self.timeout = timeout
+        self.max_bins = max_bins
+
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=ctypes.sizeof(SharedSnapshot) + 4 * max_bins
+        )
+        self._snapshot = SharedSnapshot.from_buffer(self._shm.buf)
+        self._spectrum = np.ndarray(
+            (max_bins,),
+            dtype=np.uint32,
+            buffer=self._shm.buf,
+            offset=ctypes.sizeof(SharedSnapshot),
+        )
+        self._spectrum.flags.writeable = False  # only the sampler writes
+
+        self._acquisition_status = None
+        self._status_time = 0.0
+        self._last_read = AcqStatus(), AcqSettings(), BOARDSETTING(), 0.0
+        self._last_spectrum = AcqStatus(), 0.0, 0  # status, status time, bins
+        self._last_heartbeat = 0.0
+        self._commands = None
+        self._process = None
+        self._start_time = 0.0
+        self.start()
+
+    @property
+    def acquisition_settings(self) -> AcqSettings:
+        """Get the acquisition settings of the last snapshot."""
+        return self._read()[1]
+
+    @property
+    def acquisition_status(self):
+        """Get the acquisition status of the last update."""
+        return self._acquisition_status
+
+    @property
+    def active_channel(self) -> int:
+        """Get / set the active channel (starts counting at zero!)"""
+        return self._snapshot.active_channel
+
+    @active_channel.setter
+    def active_channel(self, value: int):
+        self._snapshot.active_channel = value
+
+    @property
+    def bin_width(self) -> float:
+        """Get the width of one spectrum bin in microseconds."""
+        return BIN_WIDTH * 2**self.acquisition_settings.bitshift
+
+    @property
+    def board_settings(self) -> BOARDSETTING:
+        """Get the board settings of the last snapshot."""
+        return self._read()[2]
+
+    @property
+    def is_measuring(self) -> bool:
+        """Get status if the device is measuring.
+
+        :return: Status of measurement, ``False`` if the sampler is stalled.
+        """
+        if self.is_stalled:
+            return False
+        self._update_acquisition_status()
+        return self._acquisition_status.started == 1
+
+    @property
+    def is_stalled(self) -> bool:
+        """Get if the sampler process is dead, stalled, or the DLL calls keep failing.
+
+        A single failed DLL call, e.g., a transient error, does not count, only
+        ``max_errors`` failed samples in a row.
+        """
+        if self._process is None or not self._process.is_alive():
+            return True
+        heartbeat = self._snapshot.heartbeat
+        if heartbeat == 0:  # no sample yet, process and DLL might still be loading
+            return time.monotonic() - self._start_time > self.startup_timeout
+        return (
+            time.monotonic() - heartbeat > self.timeout
+            or self._snapshot.error >= self.max_errors
+        )
+
+    @property
+    def range(self) -> int:
+        """Get / set the range of the recording."""
+        return self.acquisition_settings.range
+
+    @range.setter
+    def range(self, value: int):
+        self.apply_settings(range=value)
+
+    @property
+    def roi(self) -> Tuple[int, int]:
+        """Get / set the ROI of the MCS8a as tuple of minimum and maximum bin."""
+        settings = self.acquisition_settings
+        return settings.roimin, settings.roimax
+
+    @roi.setter
+    def roi(self, value: Tuple[int, int]):
+        self.apply_settings(roimin=value[0], roimax=value[1])
+
+    @property
+    def roi_rate(self) -> float:
+        """Get the rate countrate in counts per seconds in the ROI."""
+        self._update_acquisition_status()
+        return self._acquisition_status.roirate
+
+    @property
+    def spectrum(self) -> np.ndarray:
+        """Get the spectrum of the active channel, without copying it.
+
+        The returned array is a read-only view into the shared memory, the
+        acquisition status is updated to the snapshot the view was taken from.
+        Later snapshots update the counts while the view is read, use
+        ``spectrum_window`` for counts that must belong to the status, e.g., to
+        calculate rates. The first access requests the sampler to also read the
+        spectrum, until then the spectrum is empty.
+
+        :return: Counts per bin.
+        """
+        return self._read_spectrum(0, None)
+
+    @property
+    def status_time(self) -> float:
+        """Get the ``time.monotonic()`` the sampler read the acquisition status."""
+        return self._status_time
+
+    @property
+    def sweep_mode(self) -> int:
+        """Get / set the sweep mode of the board."""
+        return self.board_settings.sweepmode
+
+    @sweep_mode.setter
+    def sweep_mode(self, value: int):
+        self.apply_settings(sweepmode=value)
+
+    # METHODS #
+
+    def apply_settings(self, **changes) -> int:
+        """Apply new settings to the TDC, see ``MCS8aComm.apply_settings``.
+
+        Only the changes that differ from the last snapshot are sent to the sampler.
+
+        :return: Number of settings that differ and were sent.
+        """
+        _, settings, board, _ = self._read()
+        commands, _ = settings_commands(
+            {"acquisition": settings, "board": board}, changes
+        )
+        if commands:
+            self._commands.put(changes)
+        return len(commands)
+
+    def refresh_settings(self) -> None:
+        """Let the sampler read the settings from the TDC again."""
+        self._commands.put("refresh")
+
+    def restart(self) -> None:
+        """Kill the sampler process and start a new one, e.g., when it stalled."""
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+        self.start()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Wait until the sampler delivered its first sample.
+
+        :param timeout: Longest time to wait in seconds, ``startup_timeout`` if
+            not given.
+
+        :return: True if the sampler is running and not stalled.
+        """
+        timeout = self.startup_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while self._snapshot.heartbeat == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self._snapshot.heartbeat != 0 and not self.is_stalled
+
+    def start(self) -> None:
+        """Start the sampler process."""
+        # a sampler killed while writing leaves the sequence odd, make it even again
+        self._snapshot.sequence += self._snapshot.sequence & 1
+        self._snapshot.heartbeat = 0
+        self._snapshot.error = 0
+        self._start_time = time.monotonic()
+        self._commands = mp.Queue()
+        self._process = mp.Process(
+            target=sampler,
+            args=(
+                self._shm.name,
+                self.dllpath,
+                self.interval,
+                self.max_bins,
+                self._commands,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+
+    def spectrum_window(self, bin_min: int, bin_max: int) -> np.ndarray:
+        """Get a copy of a range of bins of the spectrum of the active channel.
+
+        Only the requested bins are copied, from the same snapshot as the
+        acquisition status, which is updated as well, such that
+        ``acquisition_status.runtime`` belongs to the returned counts.
+
+        :param bin_min: First bin.
+        :param bin_max: Bin after the last one, bins beyond the spectrum are omitted.
+
+        :return: Counts per bin.
+        """
+        return self._read_spectrum(bin_min, bin_max)
+
+    def stop(self) -> None:
+        """Stop the sampler process and release the shared memory."""
+        if self._process is not None:
+            self._commands.put(None)
+            self._process.join(self.timeout)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+            self._process = None
+
+        del self._snapshot, self._spectrum
+        self._shm.close()
+        self._shm.unlink()
+
+    def _read(self) -> Tuple[AcqStatus, AcqSettings, BOARDSETTING, float]:
+        """Read a consistent copy of the status and settings of the last snapshot.
+
+        If no consistent copy can be read, e.g., because the sampler died while
+        writing, the last consistent copy is returned.
+
+        :return: Status, acquisition settings, board settings, time the status was
+            read.
+        """
+        snapshot = self._snapshot
+        for _ in range(100):
+            sequence = snapshot.sequence
+            if sequence % 2 == 0:
+                heartbeat = snapshot.heartbeat
+                duration = snapshot.duration
+                status = AcqStatus.from_buffer_copy(snapshot.status)
+                settings = AcqSettings.from_buffer_copy(snapshot.settings)
+                board = BOARDSETTING.from_buffer_copy(snapshot.board)
+                status_time = snapshot.status_time
+                if snapshot.sequence == sequence:
+                    if heartbeat != self._last_heartbeat:
+                        self._last_heartbeat = heartbeat
+                        DLL_LATENCY.observe(duration)
+                    self._last_read = status, settings, board, status_time
+                    break
+            time.sleep(0)
+        return self._last_read
+
+    def _read_spectrum(self, bin_min: int, bin_max: Optional[int]) -> np.ndarray:
+        """Read bins of the spectrum and update the status to the same snapshot.
+
+        If no consistent snapshot can be read, the status of the last consistent one
+        is used.
+
+        :param bin_min: First bin.
+        :param bin_max: Bin after the last one, ``None`` for a view of the whole
+            spectrum instead of a copy.
+
+        :return: Counts per bin.
+        """
+        self._snapshot.spectrum_requested = 1
+        snapshot = self._snapshot
+        for _ in range(100):
+            sequence = snapshot.sequence
+            if sequence % 2 == 0:
+                status = AcqStatus.from_buffer_copy(snapshot.status)
+                status_time = snapshot.status_time
+                num_bins = snapshot.num_bins
+                stop = num_bins if bin_max is None else min(bin_max, num_bins)
+                spectrum = self._spectrum[min(bin_min, stop) : stop]
+                if bin_max is not None:
+                    spectrum = spectrum.copy()
+                if snapshot.sequence == sequence:
+                    self._last_spectrum = status, status_time, num_bins
+                    break
+            time.sleep(0)
+        else:
+            status, status_time, num_bins = self._last_spectrum
+            stop = num_bins if bin_max is None else min(bin_max, num_bins)
+            spectrum = self._spectrum[min(bin_min, stop) : stop]
+            if bin_max is not None:
+                spectrum = spectrum.copy()
+        self._acquisition_status = status
+        self._status_time = status_time
+        return spectrum
+
+    def _update_acquisition_status(self) -> None:
+        """Update the acquisition status from the last snapshot."""
+        status, _, _, status_time = self._read()
+        self._acquisition_status = status
+        self._status_time = status_time
@@ -0,0 +1,295 @@
+"""Analyze how well the regulation worked, based on a recorded session history.
+
+All analyses are vectorized numpy operations on the history, such that runs with
+millions of samples are analyzed in seconds.
+The analysis can also be run from the command line:
+
+    python analysis.py session.npy
+"""
+
+import argparse
+import sys
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from history import EVENT_BURST, EVENT_SAMPLE, load_history
+
+
+def median_interval(times: np.ndarray) -> float:
+    """Median interval between samples with different times.
+
+    Samples can share a timestamp, e.g., a burst and the sample that caused it, the
+    zero intervals between them are not the sampling interval.
+
+    :param times: Times of the samples in seconds.
+
+    :return: Median interval in seconds, 0 if all samples have the same time.
+    """
+    durations = np.diff(times)
+    durations = durations[durations > 0]
+    if durations.shape[0] == 0:
+        return 0.0
+    return float(np.median(durations))
+
+
+def valid_intervals(times: np.ndarray, gap_factor: float = 5.0) -> np.ndarray:
+    """Find the intervals between samples that are not gaps in the recording.
+
+    While the automatic control is off, no samples are recorded. An interval that
+    is longer than ``gap_factor`` median intervals (see ``median_interval``) is such
+    a gap, the rate before it is not known to be valid during it.
+
+    :param times: Times of the samples in seconds.
+    :param gap_factor: Intervals longer than this many median intervals are gaps.
+
+    :return: Per interval between two samples, if it is valid.
+    """
+    durations = np.diff(times)
+    if durations.shape[0] == 0:
+        return np.zeros(0, dtype=bool)
+    return durations <= gap_factor * median_interval(times)
+
+
+def time_in_window(
+    times: np.ndarray,
+    rates: np.ndarray,
+    window_min: np.ndarray,
+    window_max: np.ndarray,
+    gap_factor: float = 5.0,
+) -> float:
+    """Fraction of the time the count rate was inside the target window.
+
+    Every rate is assumed to be valid until the next one was measured, gaps in the
+    recording are excluded, see ``valid_intervals``.
+
+    :param times: Times of the samples in seconds.
+    :param rates: Count rates in counts per second.
+    :param window_min: Lower limit of the window, per sample or scalar.
+    :param window_max: Upper limit of the window, per sample or scalar.
+    :param gap_factor: Intervals longer than this many median intervals are gaps.
+
+    :return: Fraction of the time in the window, NaN if there are too few samples.
+    """
+    if times.shape[0] < 2:
+        return np.nan
+    durations = np.diff(times) * valid_intervals(times, gap_factor)
+    in_window = (rates >= window_min) & (rates <= window_max)
+    return np.sum(durations * in_window[:-1]) / np.sum(durations)
+
+
+def deviation_histogram(
+    rates: np.ndarray,
+    window_min: np.ndarray,
+    window_max: np.ndarray,
+    bins: int = 40,
+    limit: float = 4.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Distribution of the deviations of the rates from the center of the window.
+
+    Deviations are given in units of half the window width, i.e., -1 and 1 are the
+    lower and upper limit of the window.
+
+    :param rates: Count rates in counts per second.
+    :param window_min: Lower limit of the window, per sample or scalar.
+    :param window_max: Upper limit of the window, per sample or scalar.
+    :param bins: Number of bins of the histogram.
+    :param limit: Deviations are histogrammed from -limit to limit, outliers are
+        put into the outermost bins.
+
+    :return: Counts per bin, bin edges.
+    """
+    center = 0.5 * (window_max + window_min)
+    half_width = 0.5 * (window_max - window_min)
+    deviations = np.clip((rates - center) / half_width, -limit, limit)
+    return np.histogram(deviations, bins=bins, range=(-limit, limit))
+
+
+def allan_deviation(
+    times: np.ndarray, rates: np.ndarray, num_taus: int = 20, gap_factor: float = 5.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Overlapping Allan deviation of the count rate.
+
+    The recording is split into segments at gaps, see ``valid_intervals``. Each
+    segment is resampled to a uniform time grid with the median sampling interval,
+    see ``median_interval`` (every rate is valid until the next one was measured).
+    The averages over all averaging times are calculated from the cumulative sum
+    per segment, averages spanning a gap are not used.
+
+    :param times: Times of the samples in seconds.
+    :param rates: Count rates in counts per second.
+    :param num_taus: Maximum number of logarithmically spaced averaging times.
+    :param gap_factor: Intervals longer than this many median intervals are gaps.
+
+    :return: Averaging times in seconds, Allan deviations in counts per second.
+    """
+    if times.shape[0] < 4:
+        return np.zeros(0), np.zeros(0)
+
+    delta_t = median_interval(times)
+    if delta_t <= 0:
+        return np.zeros(0), np.zeros(0)
+    starts = np.concatenate(
+        ([0], np.flatnonzero(~valid_intervals(times, gap_factor)) + 1)
+    )
+    ends = np.append(starts[1:], times.shape[0])
+    cumsums = []
+    for start, end in zip(starts, ends):
+        segment_times = times[start:end]
+        grid = np.arange(segment_times[0], segment_times[-1], delta_t)
+        indexes = np.searchsorted(segment_times, grid, side="right") - 1
+        cumsums.append(np.concatenate(([0.0], np.cumsum(rates[start:end][indexes]))))
+
+    num_points = max(cumsum.shape[0] - 1 for cumsum in cumsums)
+    factors = np.unique(
+        np.logspace(0, np.log10(max(num_points // 3, 1)), num_taus).astype(int)
+    )
+
+    adevs = np.full(factors.shape[0], np.nan)
+    for it, factor in enumerate(factors):
+        sum_squares, count = 0.0, 0
+        for cumsum in cumsums:
+            averages = (cumsum[factor:] - cumsum[:-factor]) / factor
+            differences = averages[factor:] - averages[:-factor]
+            sum_squares += np.sum(differences**2)
+            count += differences.shape[0]
+        if count:
+            adevs[it] = np.sqrt(0.5 * sum_squares / count)
+    valid = np.isfinite(adevs)  # longer than all segments
+    return factors[valid] * delta_t, adevs[valid]
+
+
+class DriftFit(NamedTuple):
+    """Linear model of the count rate versus time and stage position.
+
+    The rate is ``rate + drift * (t - time) + gain * (position - position_0)``,
+    relative to the time and position of the last sample.
+    """
+
+    rate: float  # count rate at the last sample in cps
+    drift: float  # change of the rate at a fixed position in cps / s
+    gain: float  # change of the rate with the position in cps / deg, NaN if unknown
+    time: float  # time of the last sample in seconds
+
+
+def fit_drift(
+    times: np.ndarray, rates: np.ndarray, positions: np.ndarray, min_samples: int = 5
+) -> Optional[DriftFit]:
+    """Fit the count rate linearly in time and stage position by least squares.
+
+    While the sample depletes, the rate drifts down at a fixed position. The gain
+    can only be determined if the stage moved during the fitted samples, otherwise
+    only the rate and the drift are fitted and the gain is NaN.
+
+    :param times: Times of the samples in seconds.
+    :param rates: Count rates in counts per second.
+    :param positions: Stage positions in degrees.
+    :param min_samples: Minimum number of valid samples.
+
+    :return: Fitted model, ``None`` if there are too few samples.
+    """
+    valid = np.isfinite(rates) & np.isfinite(positions)
+    times, rates, positions = times[valid], rates[valid], positions[valid]
+    if times.shape[0] < min_samples or np.ptp(times) <= 0:
+        return None
+
+    columns = [np.ones_like(times), times - times[-1]]
+    moved = np.ptp(positions) > 1e-6
+    if moved:
+        columns.append(positions - positions[-1])
+    coefficients = np.linalg.lstsq(np.stack(columns, axis=1), rates, rcond=None)[0]
+    gain = coefficients[2] if moved else np.nan
+    return DriftFit(coefficients[0], coefficients[1], gain, times[-1])
+
+
+def event_statistics(times: np.ndarray, duration: float) -> Dict[str, float]:
+    """Statistics of events, e.g., movements or bursts.
+
+    :param times: Times of the events in seconds.
+    :param duration: Total duration of the session in seconds.
+
+    :return: Number of events, events per minute, mean and median time between
+        two events in seconds.
+    """
+    intervals = np.diff(times)
+    return {
+        "count": times.shape[0],
+        "per_minute": times.shape[0] / duration * 60 if duration > 0 else np.nan,
+        "mean_interval": np.mean(intervals) if intervals.shape[0] else np.nan,
+        "median_interval": np.median(intervals) if intervals.shape[0] else np.nan,
+    }
+
+
+def analyze(history: np.ndarray) -> Dict:
+    """Analyze a session history.
+
+    :param history: Records of the history, see ``history.HISTORY_DTYPE``.
+
+    :return: Dictionary with the results of all analyses.
+    """
+    samples = history[history["event"] == EVENT_SAMPLE]
+    moves = history[history["event"] != EVENT_SAMPLE]
+    bursts = history[history["event"] == EVENT_BURST]
+
+    times = samples["time"]
+    rates = samples["rate"]
+    window_min = samples["window_min"].astype(float)
+    window_max = samples["window_max"].astype(float)
+    duration = history["time"][-1] - history["time"][0] if history.shape[0] else 0.0
+
+    taus, adevs = allan_deviation(times, rates)
+    return {
+        "duration": duration,
+        "num_samples": samples.shape[0],
+        "mean_rate": np.mean(rates) if rates.shape[0] else np.nan,
+        "std_rate": np.std(rates) if rates.shape[0] else np.nan,
+        "time_in_window": time_in_window(times, rates, window_min, window_max),
+        "deviation_histogram": deviation_histogram(rates, window_min, window_max),
+        "allan_deviation": (taus, adevs),
+        "moves": event_statistics(moves["time"], duration),
+        "bursts": event_statistics(bursts["time"], duration),
+    }
+
+
+def format_summary(results: Dict) -> str:
+    """Format the results of an analysis as human readable text.
+
+    :param results: Results of ``analyze``.
+
+    :return: Summary text.
+    """
+    lines = [
+        f"Duration: {results['duration'] / 60:.1f} min",
+        f"Samples: {results['num_samples']}",
+        f"Mean rate: {results['mean_rate']:.1f} +/- {results['std_rate']:.1f} cps",
+        f"Time in window: {results['time_in_window'] * 100:.1f} %",
+    ]
+    for name in ("moves", "bursts"):
+        stats = results[name]
+        lines.append(
+            f"{name.capitalize()}: {stats['count']} "
+            f"({stats['per_minute']:.2f} per min, "
+            f"median interval {stats['median_interval']:.1f} s)"
+        )
+
+    taus, adevs = results["allan_deviation"]
+    if taus.shape[0]:
+        lines.append("Allan deviation:")
+        for tau, adev in zip(taus, adevs):
+            lines.append(f"  {tau:10.1f} s: {adev:10.1f} cps")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> None:
+    """Analyze a saved session history from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Analyze the regulation of a recorded session."
+    )
+    parser.add_argument("history", help="Session history file (.npy).")
+    args = parser.parse_args(argv)
+
+    print(format_summary(analyze(load_history(args.history))))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,13 +1,36 @@
 """Automatically control the desorption laser power."""
 
 # from PyQt5.QtWidgets import QMessageBox
+import math
+import time
+from typing import Tuple
+
+import numpy as np
 from PyQt6.QtCore import QTimer
 
+from analysis import fit_drift
+from events import (
+    MOVE_BURST,
+    MOVE_DOWN,
+    MOVE_STEP,
+    MOVE_UP,
+    EventBus,
+    MoveRequest,
+    PositionRead,
+    Sample,
+)
+from history import EVENT_SAMPLE
+import metrics
 from mcs8a import MCS8aComm
 from power_control import PowerControl
+from roi import MultiRoiRate
 
 
 class LaserAutoControl:
+    min_interval = 0.2  # shortest time between two checks in adaptive mode (s)
+    idle_interval = 1.0  # longest time between two checks in adaptive mode (s)
+    min_step = 1e-3  # smaller predictive steps are not done (deg)
+
     def __init__(
         self,
         parent,
@@ -18,6 +41,16 @@ class LaserAutoControl:
         range_max: int,
         range_emg: int,
         tdc_ch: int,
+        roi_rates: MultiRoiRate = None,
+        roi_name: str = None,
+        adaptive: bool = False,
+        confidence: float = 2.0,
+        sweeps_per_block: int = 0,
+        predictive: bool = False,
+        predict_window: float = 120.0,
+        max_step: float = 1.0,
+        bus: EventBus = None,
+        position: float = math.nan,
     ):
         """Automatic laser control.
 
@@ -28,8 +61,33 @@ class LaserAutoControl:
         :param range_max: Maximum range
         :param range_emg: Emergency range
         :param tdc_ch: Channel of the the TDC stop signal.
+        :param roi_rates: Multi ROI rate calculator. If given, the regulation uses the
+            rate of the ROI ``roi_name`` calculated from the spectrum instead of the
+            ROI configured in the MCS8a software.
+        :param roi_name: Name of the ROI to regulate on.
+        :param adaptive: Adapt the integration time of each regulation cycle to the
+            counting statistics. In this case, ``delta_t`` is the longest
+            integration time.
+        :param confidence: Confidence level in standard deviations at which a
+            deviation from the window is significant in adaptive mode.
+        :param sweeps_per_block: If larger than zero, regulate synchronized to the
+            sweeps of the TDC: the rate is evaluated over blocks of this many sweeps
+            that start after the last movement, and the stage is only moved at the
+            end of a block (bursts excepted). Takes precedence over ``adaptive``.
+        :param predictive: Fit the drift of the rate with time and stage position to
+            the samples of the session history and move ahead of the predicted rate,
+            see ``predictive_adjustment``. Takes precedence over ``adaptive``.
+        :param predict_window: Time span of the samples that are fitted in seconds.
+        :param max_step: Largest predictive step in degrees.
+        :param bus: Event bus to publish the samples and the movement requests on,
+            see ``events``. The stage position is taken from its ``PositionRead``
+            events.
+        :param position: Current position of the stage in degrees.
         """
         self.parent = parent
+        self.bus = EventBus() if bus is None else bus
+        self.position = position
+        self._subscription = self.bus.subscribe(PositionRead, self._positions_read)
 
         self.mcs8a = mcs8a
 
@@ -38,22 +96,54 @@ class LaserAutoControl:
         self.range_min = range_min
         self.range_max = range_max
         self.delta_range = range_max - range_min
+        self.center = 0.5 * (range_min + range_max)
         self.range_emg = range_emg
 
         self.mcs8a.active_channel = tdc_ch - 1  # set stop channel
 
+        self.roi_rates = roi_rates
+        self.roi_name = roi_name
+
+        self.adaptive = adaptive
+        self.confidence = confidence
+        self.sweeps_per_block = sweeps_per_block
+        self.predictive = predictive
+        self.predict_window = predict_window
+        self.max_step = max_step
+
         self._is_running = False
+        self._moving = False
+        self._integration_start = None  # (runtime, counts) after the last move
+        self._last_sample = None  # (runtime, counts) of the last check
+        self._last_rate = None  # (time, rate) of the last rate that was recorded
+        self._block_start = None  # (runtime, counts, sweeps) at start of the block
+        self._move_end = 0.0  # time.monotonic() the last movement finished
+        self._gain = None  # last fitted change of the rate with the position
 
         self.wait_timer = QTimer()
 
+    @property
+    def is_running(self) -> bool:
+        """Get if the automatic control is active."""
+        return self._is_running
+
     # Activate / Deactivate #
 
     def activate(self):
-        """Activate auto control."""
+        """Activate auto control, or resume it after a movement has finished."""
+        self._move_end = time.monotonic()
+        self._moving = False
+        self._integration_start = None
+        self._block_start = None
+
         if self._is_running:  # already running...
             return
 
         self._is_running = True
+        self._last_rate = None
+        metrics.WINDOW_MIN.set(self.range_min)
+        metrics.WINDOW_MAX.set(self.range_max)
+        metrics.WINDOW_BURST.set(self.range_emg)
         self.wait_timer.timeout.connect(self.do_adjustment)
         self.do_adjustment()
 
@@ -62,28 +152,57 @@ class LaserAutoControl:
         self._is_running = False
         self.wait_timer.stop()
         self.wait_timer.disconnect()
-        self.parent.cps_label.setText("")
+
+    def close(self):
+        """Stop receiving events, call when the auto control is discarded."""
+        self.bus.unsubscribe(self._subscription)
 
     def do_adjustment(self):
         """Does an adjustment."""
         if not self._is_running:
             return
 
-        # if the acquisition is not running, quit
-        if not self.mcs8a.is_measuring:
+        # if the acquisition is not running or the TDC is being reconnected, wait
+        try:
+            measuring = self.mcs8a is not None and self.mcs8a.is_measuring
+        except OSError as err:  # DLL failure
+            self.parent.mcs8a_connection_lost(str(err))
+            measuring = False
+        if not measuring:
+            self.wait_timer.start(int(self.idle_interval * 1000))
+            return
+
+        # samples taken during a movement are useless, wait until it has finished
+        if self._moving:
+            polling = self.adaptive or self.sweeps_per_block > 0
+            interval = self.min_interval * 1000 if polling else self.delta_t
+            self.wait_timer.start(int(interval))
+            return
+
+        if self.sweeps_per_block > 0:
+            self.wait_timer.start(int(self.sweep_adjustment() * 1000))
+            return
+
+        if self.predictive:
+            self.predictive_adjustment()
+            self.wait_timer.start(self.delta_t)
+            return
+
+        if self.adaptive:
+            self.wait_timer.start(int(self.adaptive_adjustment() * 1000))
             return
 
         # DO ADJUSTMENT ROUTINE
-        current_cps = self.mcs8a.roi_rate
-        self.parent._set_cps_label(current_cps)
+        current_cps = self.current_rate()
+        self._record_rate(current_cps)
 
         # COMPARE
         if current_cps > self.range_emg:  # EMERGENCY TURN DOWN
-            self.parent.auto_burst_decrease()
+            self._move(MOVE_BURST)
         elif current_cps < self.range_min + self.delta_range / 3:  # regular increase
-            self.parent.auto_increase()
+            self._move(MOVE_UP)
         elif current_cps > self.range_max - self.delta_range / 3:
-            self.parent.auto_decrease()
+            self._move(MOVE_DOWN)
 
         # status = self.mcs8a.acquisition_status
 
@@ -105,3 +224,245 @@ class LaserAutoControl:
 
         # thread out timer
         self.wait_timer.start(self.delta_t)
+
+    def adaptive_adjustment(self) -> float:
+        """Adjust if the deviation from the window is statistically significant.
+
+        The counts since the last movement are integrated. As soon as the rate
+        deviates significantly from the window (lower / upper third of the ROI
+        range) or exceeds the burst level, the stage is moved. If the deviation is
+        not significant, the integration continues. After the longest integration
+        time, the regular rule is applied to the integrated rate.
+
+        :return: Time until the next check in seconds.
+        """
+        runtime, counts = self.current_counts()
+        last_sample = self._last_sample
+        self._last_sample = runtime, counts
+
+        if self._integration_start is None or runtime < self._integration_start[0]:
+            self._integration_start = runtime, counts
+            return self.min_interval
+
+        integration_time = runtime - self._integration_start[0]
+        if integration_time <= 0:
+            return self.min_interval
+
+        num_counts = counts - self._integration_start[1]
+        current_cps = num_counts / integration_time
+        sigma = math.sqrt(max(num_counts, 1)) / integration_time
+        self._record_rate(current_cps)
+
+        # bursts are detected on the rate since the last check to react quickly
+        burst_cps, burst_sigma = current_cps, sigma
+        if last_sample is not None and (burst_time := runtime - last_sample[0]) > 0:
+            burst_counts = counts - last_sample[1]
+            burst_cps = burst_counts / burst_time
+            burst_sigma = math.sqrt(max(burst_counts, 1)) / burst_time
+
+        lower = self.range_min + self.delta_range / 3
+        upper = self.range_max - self.delta_range / 3
+        max_time = self.delta_t / 1000
+        significance = self.confidence * sigma
+
+        if burst_cps - self.range_emg > self.confidence * burst_sigma:
+            self._move(MOVE_BURST)
+        elif lower - current_cps > significance:
+            self._move(MOVE_UP)
+        elif current_cps - upper > significance:
+            self._move(MOVE_DOWN)
+        elif integration_time >= max_time:  # no significance reached: regular rule
+            if current_cps < lower:
+                self._move(MOVE_UP)
+            elif current_cps > upper:
+                self._move(MOVE_DOWN)
+            else:
+                self._integration_start = runtime, counts
+                return self.idle_interval
+        else:
+            # estimate when the current deviation would become significant
+            deviation = max(lower - current_cps, current_cps - upper)
+            if deviation > 0:
+                time_needed = self.confidence**2 * max(current_cps, 1) / deviation**2
+                wait = time_needed - integration_time
+            else:
+                wait = self.idle_interval
+            return max(
+                min(wait, max_time - integration_time, self.idle_interval),
+                self.min_interval,
+            )
+
+        return self.min_interval
+
+    def predictive_adjustment(self) -> None:
+        """Move the stage ahead of the predicted drift of the rate.
+
+        The rate is fitted linearly in time and stage position to the samples of
+        the last ``predict_window`` seconds, see ``analysis.fit_drift``. If the rate
+        predicted for the next check leaves the middle third of the window, the stage
+        is moved ahead of the drift: the predicted rate is brought half way from the
+        center to the edge of the middle third that lies against the drift, such
+        that the rate drifts through the center until the next movement. Steps are
+        limited to ``max_step``. Until the change of the rate with the position is
+        known, i.e., before the first movement, the regular rule is applied.
+        """
+        current_cps = self.current_rate()
+        sample = self._record_rate(current_cps)
+
+        lower = self.range_min + self.delta_range / 3
+        upper = self.range_max - self.delta_range / 3
+
+        if current_cps > self.range_emg:
+            self._move(MOVE_BURST)
+            return
+
+        # the current sample is recorded in the history only when the bus delivers it
+        now = sample.time
+        recent = self.parent.history.since(now - self.predict_window)
+        samples = recent[(recent["event"] == EVENT_SAMPLE) & (recent["time"] < now)]
+        fit = fit_drift(
+            np.append(samples["time"], now),
+            np.append(samples["rate"], current_cps),
+            np.append(samples["position"], sample.position),
+        )
+        if fit is not None and fit.gain > 0:  # NaN if the stage did not move
+            self._gain = fit.gain
+
+        if fit is None or self._gain is None:
+            if current_cps < lower:
+                self._move(MOVE_UP)
+            elif current_cps > upper:
+                self._move(MOVE_DOWN)
+            return
+
+        predicted = fit.rate + fit.drift * (now + self.delta_t / 1000 - fit.time)
+        if lower <= predicted <= upper:
+            return
+
+        aim = self.center - math.copysign(self.delta_range / 12, fit.drift)
+        step = min(max((aim - predicted) / self._gain, -self.max_step), self.max_step)
+        if abs(step) >= self.min_step:
+            self._move(MOVE_STEP, step)
+
+    def sweep_adjustment(self) -> float:
+        """Adjust at the end of each block of sweeps of the TDC.
+
+        A block starts with the first sample that the TDC took after a movement has
+        finished, such that its rate is never affected by a movement. With the
+        separate acquisition process, the last snapshot can be older than the end
+        of the movement, such a sample is skipped. When the block has
+        ``sweeps_per_block`` sweeps, the regular rule is applied to its rate and a
+        new block is started. Bursts are checked on the rate since the last sample
+        and decreased immediately.
+
+        :return: Time until the next check in seconds.
+        """
+        runtime, counts = self.current_counts()
+        sweeps = self.mcs8a.acquisition_status.sweeps
+        last_sample = self._last_sample
+        self._last_sample = runtime, counts
+
+        block_start = self._block_start
+        if block_start is None or sweeps < block_start[2]:  # new block / acquisition
+            if self.mcs8a.status_time > self._move_end:
+                self._block_start = runtime, counts, sweeps
+            return self.min_interval
+
+        if last_sample is not None and (burst_time := runtime - last_sample[0]) > 0:
+            if (counts - last_sample[1]) / burst_time > self.range_emg:
+                self._move(MOVE_BURST)
+                return self.min_interval
+
+        block_sweeps = sweeps - block_start[2]
+        block_time = runtime - block_start[0]
+        if block_sweeps < self.sweeps_per_block or block_time <= 0:
+            if block_sweeps <= 0 or block_time <= 0:
+                return self.min_interval
+            remaining = (
+                (self.sweeps_per_block - block_sweeps) * block_time / block_sweeps
+            )
+            return max(min(remaining, self.idle_interval), self.min_interval)
+
+        current_cps = (counts - block_start[1]) / block_time
+        self._record_rate(current_cps)
+
+        if current_cps < self.range_min + self.delta_range / 3:
+            self._move(MOVE_UP)
+        elif current_cps > self.range_max - self.delta_range / 3:
+            self._move(MOVE_DOWN)
+        else:
+            self._block_start = runtime, counts, sweeps
+        return self.min_interval
+
+    def current_counts(self) -> Tuple[float, float]:
+        """Get the current runtime and counts of the ROI to regulate on.
+
+        :return: Runtime of the acquisition in seconds, counts in the ROI.
+        """
+        if self.roi_rates is None:
+            status = self.mcs8a.acquisition_status
+            return status.runtime, status.roisum
+
+        runtime = self._update_roi_rates()
+        return runtime, self.roi_rates.sums[self.roi_name]
+
+    def current_rate(self) -> float:
+        """Get the current count rate of the ROI to regulate on.
+
+        :return: Count rate in counts per second.
+        """
+        if self.roi_rates is None:
+            return self.mcs8a.roi_rate
+
+        self._update_roi_rates()
+        return self.roi_rates.rate(self.roi_name)
+
+    def _update_roi_rates(self) -> float:
+        """Update the ROI rates with the bins of the ROIs of the current spectrum.
+
+        :return: Runtime of the acquisition that belongs to the spectrum in seconds.
+        """
+        bin_min, bin_max = self.roi_rates.bin_range
+        counts = self.mcs8a.spectrum_window(bin_min, bin_max)  # updates the status
+        runtime = self.mcs8a.acquisition_status.runtime
+        self.roi_rates.update(counts, runtime, offset=bin_min)
+        return runtime
+
+    def _positions_read(self, events: list) -> None:
+        """Take the stage position from the last of a batch of ``PositionRead``."""
+        self.position = events[-1].position
+
+    def _record_rate(self, rate: float) -> Sample:
+        """Record the current rate in the metrics and publish it as sample.
+
+        The time since the last recorded rate counts as in the window if that rate
+        was inside the window. The sample is recorded in the session history by a
+        subscriber of the bus.
+
+        :param rate: Current count rate in counts per second.
+
+        :return: Published sample.
+        """
+        now = time.monotonic()
+        if self._last_rate is not None:
+            last_time, last_rate = self._last_rate
+            metrics.REGULATED_SECONDS.inc(now - last_time)
+            if self.range_min <= last_rate <= self.range_max:
+                metrics.IN_WINDOW_SECONDS.inc(now - last_time)
+        self._last_rate = now, rate
+        metrics.ROI_RATE.set(rate)
+
+        sample = Sample(time.time(), rate, self.position)
+        self.bus.publish(sample)
+        return sample
+
+    def _move(self, kind: int, step: float = math.nan) -> None:
+        """Request a movement on the event bus and wait until it has finished.
+
+        :param kind: Kind of the movement, e.g., ``events.MOVE_UP``.
+        :param step: Step in degrees for ``events.MOVE_STEP``.
+        """
+        self._moving = True
+        self._integration_start = None
+        self._block_start = None
+        self.bus.publish(MoveRequest(time.time(), kind, step))
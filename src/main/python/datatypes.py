@@ -12,44 +12,48 @@ class AcqStatus(ctypes.Structure):
     """Create a structured Data type with ctypes where the dll can write into.
     This object handles and retrieves the acquisition status data from the
     Fastcomtec.
-    int started;                // acquisition status: 1 if running, 0 else
+    unsigned long started;      // acquisition status: 1 if running, 0 else
+    unsigned long maxval;       // Maximum value in spectrum
     double runtime;             // running time in seconds
+    double ofls;                // overflows
     double totalsum;            // total events
     double roisum;              // events within ROI
     double roirate;             // acquired ROI-events per second
-    double nettosum;            // ROI sum with background subtracted
     double sweeps;              // Number of sweeps
     double stevents;            // Start Events
-    unsigned long maxval;       // Maximum value in spectrum
+    unsigned long reserved[12];
+
+    Types are given with explicit sizes, since ``long`` is 32 bit on Windows.
     """
 
     _fields_ = [
-        ("started", ctypes.c_int),
+        ("started", ctypes.c_uint32),
+        ("maxval", ctypes.c_uint32),
         ("runtime", ctypes.c_double),
+        ("ofls", ctypes.c_double),
         ("totalsum", ctypes.c_double),
         ("roisum", ctypes.c_double),
         ("roirate", ctypes.c_double),
-        ("ofls", ctypes.c_double),
         ("sweeps", ctypes.c_double),
         ("stevents", ctypes.c_double),
-        ("maxval", ctypes.c_ulong),
+        ("reserved", ctypes.c_uint32 * 12),
     ]
 
 
 class AcqSettings(ctypes.Structure):
     _fields_ = [
-        ("range", ctypes.c_long),
-        ("cftfak", ctypes.c_long),
-        ("roimin", ctypes.c_long),
-        ("roimax", ctypes.c_long),
-        ("nregions", ctypes.c_long),
-        ("caluse", ctypes.c_long),
-        ("calpoints", ctypes.c_long),
-        ("param", ctypes.c_long),
-        ("offset", ctypes.c_long),
-        ("xdim", ctypes.c_long),
-        ("bitshift", ctypes.c_ulong),
-        ("active", ctypes.c_long),
+        ("range", ctypes.c_int32),
+        ("cftfak", ctypes.c_int32),
+        ("roimin", ctypes.c_int32),
+        ("roimax", ctypes.c_int32),
+        ("nregions", ctypes.c_int32),
+        ("caluse", ctypes.c_int32),
+        ("calpoints", ctypes.c_int32),
+        ("param", ctypes.c_int32),
+        ("offset", ctypes.c_int32),
+        ("xdim", ctypes.c_int32),
+        ("bitshift", ctypes.c_uint32),
+        ("active", ctypes.c_int32),
         ("eventpreset", ctypes.c_double),
         ("dummy1", ctypes.c_double),
         ("dummy2", ctypes.c_double),
@@ -63,8 +67,8 @@ class ACQDATA(ctypes.Structure):
     """
 
     _fields_ = [
-        ("s0", ctypes.POINTER(ctypes.c_ulong)),
-        ("region", ctypes.POINTER(ctypes.c_ulong)),
+        ("s0", ctypes.POINTER(ctypes.c_uint32)),
+        ("region", ctypes.POINTER(ctypes.c_uint32)),
         ("comment", ctypes.c_char_p),
         ("cnt", ctypes.POINTER(ctypes.c_double)),
         ("hs0", ctypes.c_int),
@@ -76,26 +80,26 @@ class ACQDATA(ctypes.Structure):
 
 class BOARDSETTING(ctypes.Structure):
     _fields_ = [
-        ("sweepmode", ctypes.c_long),
-        ("prena", ctypes.c_long),
-        ("cycles", ctypes.c_long),
-        ("sequences", ctypes.c_long),
-        ("syncout", ctypes.c_long),
-        ("digio", ctypes.c_long),
-        ("digval", ctypes.c_long),
-        ("dac0", ctypes.c_long),
-        ("dac1", ctypes.c_long),
-        ("dac2", ctypes.c_long),
-        ("dac3", ctypes.c_long),
-        ("dac4", ctypes.c_long),
-        ("dac5", ctypes.c_long),
+        ("sweepmode", ctypes.c_int32),
+        ("prena", ctypes.c_int32),
+        ("cycles", ctypes.c_int32),
+        ("sequences", ctypes.c_int32),
+        ("syncout", ctypes.c_int32),
+        ("digio", ctypes.c_int32),
+        ("digval", ctypes.c_int32),
+        ("dac0", ctypes.c_int32),
+        ("dac1", ctypes.c_int32),
+        ("dac2", ctypes.c_int32),
+        ("dac3", ctypes.c_int32),
+        ("dac4", ctypes.c_int32),
+        ("dac5", ctypes.c_int32),
         ("fdac", ctypes.c_int),
         ("tagbits", ctypes.c_int),
         ("extclk", ctypes.c_int),
-        ("maxchan", ctypes.c_long),
-        ("serno", ctypes.c_long),
-        ("ddruse", ctypes.c_long),
-        ("active", ctypes.c_long),
+        ("maxchan", ctypes.c_int32),
+        ("serno", ctypes.c_int32),
+        ("ddruse", ctypes.c_int32),
+        ("active", ctypes.c_int32),
         ("holdafter", ctypes.c_double),
         ("swpreset", ctypes.c_double),
         ("fstchan", ctypes.c_double),
@@ -0,0 +1,138 @@
+"""Discover Thorlabs APT controllers on all serial ports at once.
+
+Candidate ports are the ones with the USB vendor and product ID of the Thorlabs
+APT controllers, other devices are never written to unless all ports are probed
+explicitly. Every candidate port is opened with a short timeout and sent the APT
+hardware information request (``HW_REQ_INFO``). APT controllers answer with their
+serial number and model (``HW_GET_INFO``), all other devices do not answer in
+time. All ports are probed concurrently, such that a discovery takes about as long
+as one timeout.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import struct
+from typing import Dict, List, NamedTuple, Optional
+
+import serial
+import serial.tools.list_ports
+
+HW_REQ_INFO = 0x0005
+HW_GET_INFO = 0x0006
+HW_INFO_LENGTH = 84  # bytes of data of the HW_GET_INFO reply
+
+APT_HOST = 0x01  # source address of the host
+APT_USB_DEVICE = 0x50  # destination address of a generic USB device
+
+APT_VID = 0x0403  # USB vendor ID of the FTDI chip in the controllers
+APT_PID = 0xFAF0  # USB product ID of the Thorlabs APT controllers
+
+
+class StageInfo(NamedTuple):
+    """APT controller that was found on a serial port."""
+
+    port: str
+    serial_number: int
+    model: str
+
+
+def probe_port(
+    port: str, baud: int = 115200, timeout: float = 0.3
+) -> Optional[StageInfo]:
+    """Check if an APT controller is connected to a serial port.
+
+    :param port: Serial port to probe.
+    :param baud: Baud rate of the APT controllers.
+    :param timeout: Time to wait for the reply in seconds.
+
+    :return: Information of the controller, ``None`` if none answered.
+    """
+    try:
+        with serial.Serial(port, baud, timeout=timeout, rtscts=True) as connection:
+            connection.reset_input_buffer()
+            connection.write(
+                struct.pack("<HBBBB", HW_REQ_INFO, 0, 0, APT_USB_DEVICE, APT_HOST)
+            )
+            for _ in range(4):  # skip a few unsolicited messages
+                header = connection.read(6)
+                if len(header) < 6:
+                    return None
+                message_id, length, destination, _ = struct.unpack("<HHBB", header)
+                has_data = destination & 0x80
+                data = connection.read(length) if has_data else b""
+                if message_id == HW_GET_INFO and len(data) == HW_INFO_LENGTH:
+                    serial_number = struct.unpack("<L", data[0:4])[0]
+                    model = data[4:12].split(b"\x00")[0].decode("ascii", "replace")
+                    return StageInfo(port, serial_number, model)
+    except (OSError, serial.SerialException):
+        pass
+    return None
+
+
+def candidate_ports(all_ports: bool = False) -> List[str]:
+    """Get the serial ports that might have an APT controller connected.
+
+    :param all_ports: Return all serial ports of the system, not only the ones with
+        the USB IDs of the APT controllers, e.g., for controllers behind an adapter.
+
+    :return: Names of the ports.
+    """
+    return [
+        info.device
+        for info in serial.tools.list_ports.comports()
+        if all_ports or (info.vid == APT_VID and info.pid == APT_PID)
+    ]
+
+
+def discover_stages(
+    ports: List[str] = None,
+    timeout: float = 0.3,
+    max_workers: int = 16,
+    all_ports: bool = False,
+) -> List[StageInfo]:
+    """Probe serial ports concurrently for APT controllers.
+
+    :param ports: Ports to probe, see ``candidate_ports`` by default.
+    :param timeout: Time to wait for the reply of each port in seconds.
+    :param max_workers: Maximum number of ports probed at the same time.
+    :param all_ports: If no ports are given, probe all serial ports of the system.
+
+    :return: All controllers that were found, sorted by port.
+    """
+    if ports is None:
+        ports = candidate_ports(all_ports)
+    if len(ports) == 0:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ports))) as executor:
+        results = executor.map(lambda port: probe_port(port, timeout=timeout), ports)
+        return sorted(
+            (info for info in results if info is not None), key=lambda it: it.port
+        )
+
+
+def find_stage(
+    serial_number: int, cache: Dict[str, str], timeout: float = 0.3
+) -> Optional[str]:
+    """Find the port of the controller with a given serial number.
+
+    The cached port is probed first. Only if the controller is not found there,
+    e.g., after the USB devices were enumerated anew, all candidate ports are
+    probed, see ``candidate_ports``. The cache is updated with all controllers that
+    were found.
+
+    :param serial_number: Serial number of the controller.
+    :param cache: Cached ports by serial number (as string, e.g., from JSON).
+    :param timeout: Time to wait for the reply of each port in seconds.
+
+    :return: Port of the controller, ``None`` if it was not found.
+    """
+    cached_port = cache.get(str(serial_number))
+    if cached_port is not None:
+        info = probe_port(cached_port, timeout=timeout)
+        if info is not None and info.serial_number == serial_number:
+            return cached_port
+        del cache[str(serial_number)]  # stale
+
+    for info in discover_stages(timeout=timeout):
+        cache[str(info.serial_number)] = info.port
+    return cache.get(str(serial_number))
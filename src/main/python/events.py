@@ -0,0 +1,160 @@
+"""Publish / subscribe event bus that decouples the components of the program.
+
+Publishers, e.g., the automatic control, publish typed events without knowing
+who receives them. Every subscriber receives the events in batches on its own
+thread: publishing only appends the event to the queue of each subscriber, the
+queue is then emptied by the event loop of the subscriber's thread. A slow
+subscriber, e.g., a logger or a remote client, thus never delays the control loop.
+"""
+
+import collections
+import math
+import threading
+from typing import Callable, List, NamedTuple, Tuple, Type, Union
+
+from PyQt6 import QtCore
+
+# kinds of movements that can be requested
+MOVE_UP = 0  # regular step up
+MOVE_DOWN = 1  # regular step down
+MOVE_BURST = 2  # fast step down after a burst
+MOVE_STEP = 3  # step of a given size
+
+
+class Sample(NamedTuple):
+    """Count rate that was measured by the automatic control."""
+
+    time: float  # unix time in seconds
+    rate: float  # count rate in cps
+    position: float  # stage position during the sample in degrees, NaN if unknown
+
+
+class MoveRequest(NamedTuple):
+    """Movement of the stage requested by the automatic control."""
+
+    time: float  # unix time in seconds
+    kind: int  # e.g., ``MOVE_UP``
+    step: float = math.nan  # step in degrees for ``MOVE_STEP``
+
+
+class MoveFinished(NamedTuple):
+    """Movement of the stage has finished."""
+
+    time: float  # unix time in seconds
+    position: float  # position in degrees, NaN if not known yet
+
+
+class PositionRead(NamedTuple):
+    """Position of the stage was read."""
+
+    time: float  # unix time in seconds
+    position: float  # position in degrees
+
+
+class Burst(NamedTuple):
+    """Burst decrease of the laser power."""
+
+    time: float  # unix time in seconds
+    position: float  # position in degrees before the decrease
+
+
+class ConfigChanged(NamedTuple):
+    """Configuration or laser settings were changed by the user."""
+
+    time: float  # unix time in seconds
+    name: str  # "config" or "laser"
+    settings: dict  # all settings after the change
+
+
+class Subscription(QtCore.QObject):
+    """Queue of events of one subscriber, emptied in the subscriber's thread.
+
+    :param event_types: Types of the events that are delivered.
+    :param callback: Function that takes a list of events.
+    """
+
+    _wake = QtCore.pyqtSignal()
+
+    def __init__(self, event_types: Tuple[Type, ...], callback: Callable[[List], None]):
+        super().__init__()
+        self.event_types = event_types
+        self.callback = callback
+        self._queue = collections.deque()
+        self._scheduled = False
+        self._wake.connect(self._deliver, QtCore.Qt.ConnectionType.QueuedConnection)
+
+    def post(self, event) -> None:
+        """Queue an event, the delivery is scheduled if not already pending."""
+        self._queue.append(event)
+        if not self._scheduled:
+            self._scheduled = True
+            self._wake.emit()
+
+    @QtCore.pyqtSlot()
+    def _deliver(self) -> None:
+        """Deliver all queued events as one batch."""
+        self._scheduled = False  # events queued from now on are delivered again
+        batch = [self._queue.popleft() for _ in range(len(self._queue))]
+        if batch:
+            self.callback(batch)
+
+
+class EventBus:
+    """Deliver published events to the subscribers of their type.
+
+    Publishing is thread safe and does not block: the subscriptions of each type
+    are an immutable tuple that is replaced when subscribers change.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}  # event type -> tuple of subscriptions
+        self._lock = threading.Lock()
+
+    def subscribe(
+        self,
+        event_types: Union[Type, Tuple[Type, ...]],
+        callback: Callable[[List], None],
+        thread: QtCore.QThread = None,
+    ) -> Subscription:
+        """Subscribe to one or several types of events.
+
+        Events of all given types are delivered in the order they were published.
+
+        :param event_types: Type or tuple of types of the events, e.g., ``Sample``.
+        :param callback: Function that takes a list of events.
+        :param thread: Thread with a running event loop to call the callback in,
+            the current thread if not given.
+
+        :return: Subscription, to unsubscribe.
+        """
+        if not isinstance(event_types, tuple):
+            event_types = (event_types,)
+        subscription = Subscription(event_types, callback)
+        if thread is not None:
+            subscription.moveToThread(thread)
+
+        with self._lock:
+            for event_type in event_types:
+                self._subscriptions[event_type] = self._subscriptions.get(
+                    event_type, ()
+                ) + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering events to a subscriber, queued events are dropped."""
+        with self._lock:
+            for event_type in subscription.event_types:
+                self._subscriptions[event_type] = tuple(
+                    it
+                    for it in self._subscriptions.get(event_type, ())
+                    if it is not subscription
+                )
+        subscription.deleteLater()
+
+    def publish(self, event) -> None:
+        """Publish an event to all subscribers of its type.
+
+        :param event: Event, e.g., an instance of ``Sample``.
+        """
+        for subscription in self._subscriptions.get(type(event), ()):
+            subscription.post(event)
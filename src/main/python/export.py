@@ -0,0 +1,155 @@
+"""Export session histories to columnar HDF5 or Parquet files.
+
+The history is written in chunks of a fixed number of records, such that exports
+of long sessions need constant memory. Together with a memory mapped history
+(see ``history.load_history``), only one chunk is in memory at any time.
+The packages ``h5py`` (HDF5) and ``pyarrow`` (Parquet) are optional and only
+needed for the respective format.
+
+A saved history can also be exported from the command line:
+
+    python export.py session.npy session.h5
+"""
+
+import argparse
+import json
+from pathlib import Path
+import sys
+from typing import Dict, Iterator
+
+import numpy as np
+
+from history import load_history
+
+HDF5_SUFFIXES = (".h5", ".hdf5")
+PARQUET_SUFFIXES = (".parquet",)
+
+
+def iter_chunks(data: np.ndarray, chunk_size: int) -> Iterator[np.ndarray]:
+    """Iterate over consecutive chunks of the records.
+
+    :param data: Records to iterate over.
+    :param chunk_size: Number of records per chunk.
+
+    :return: Iterator over the chunks, views into the records.
+    """
+    for start in range(0, data.shape[0], chunk_size):
+        yield data[start : start + chunk_size]
+
+
+def export_hdf5(
+    data: np.ndarray, fname: Path, metadata: Dict = None, chunk_size: int = 2**16
+) -> None:
+    """Export the records to an HDF5 file, one compressed dataset per field.
+
+    Metadata are stored as attributes of the root group, values that are not
+    numbers or strings are stored as JSON.
+
+    :param data: Records to export.
+    :param fname: File to write.
+    :param metadata: Metadata to tag the file with.
+    :param chunk_size: Number of records that are written at once.
+    """
+    import h5py
+
+    with h5py.File(fname, "w") as file:
+        for key, value in (metadata or {}).items():
+            if not isinstance(value, (int, float, str)):
+                value = json.dumps(value)
+            file.attrs[key] = value
+
+        datasets = {
+            name: file.create_dataset(
+                name,
+                shape=(0,),
+                maxshape=(None,),
+                dtype=data.dtype[name],
+                chunks=(min(chunk_size, max(data.shape[0], 1)),),
+                compression="gzip",
+                shuffle=True,
+            )
+            for name in data.dtype.names
+        }
+        for chunk in iter_chunks(data, chunk_size):
+            for name, dataset in datasets.items():
+                size = dataset.shape[0]
+                dataset.resize((size + chunk.shape[0],))
+                dataset[size:] = chunk[name]
+
+
+def export_parquet(
+    data: np.ndarray, fname: Path, metadata: Dict = None, chunk_size: int = 2**16
+) -> None:
+    """Export the records to a Parquet file, one row group per chunk.
+
+    Metadata are stored as JSON in the key-value metadata of the schema.
+
+    :param data: Records to export.
+    :param fname: File to write.
+    :param metadata: Metadata to tag the file with.
+    :param chunk_size: Number of records that are written at once.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            pa.field(name, pa.from_numpy_dtype(data.dtype[name]))
+            for name in data.dtype.names
+        ],
+        metadata={key: json.dumps(value) for key, value in (metadata or {}).items()},
+    )
+    with pq.ParquetWriter(fname, schema, compression="zstd") as writer:
+        for chunk in iter_chunks(data, chunk_size):
+            writer.write_table(
+                pa.Table.from_arrays(
+                    [np.ascontiguousarray(chunk[name]) for name in data.dtype.names],
+                    schema=schema,
+                )
+            )
+
+
+def export_history(
+    data: np.ndarray, fname: Path, metadata: Dict = None, chunk_size: int = 2**16
+) -> None:
+    """Export the records, the format is chosen by the suffix of the file name.
+
+    :param data: Records to export.
+    :param fname: File to write, ``.h5`` / ``.hdf5`` or ``.parquet``.
+    :param metadata: Metadata to tag the file with.
+    :param chunk_size: Number of records that are written at once.
+
+    :raises ValueError: Unknown file format.
+    :raises ImportError: Package for the file format is not installed.
+    """
+    suffix = Path(fname).suffix.lower()
+    if suffix in HDF5_SUFFIXES:
+        export_hdf5(data, fname, metadata, chunk_size)
+    elif suffix in PARQUET_SUFFIXES:
+        export_parquet(data, fname, metadata, chunk_size)
+    else:
+        raise ValueError(f"Unknown export format: {suffix}")
+
+
+def main(argv=None) -> None:
+    """Export a saved session history from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Export a recorded session to HDF5 or Parquet."
+    )
+    parser.add_argument("history", help="Session history file (.npy).")
+    parser.add_argument("output", help="Output file (.h5, .hdf5, or .parquet).")
+    parser.add_argument(
+        "--chunk-size", type=int, default=2**16, help="Records written at once."
+    )
+    args = parser.parse_args(argv)
+
+    export_history(
+        load_history(args.history),
+        args.output,
+        {"source": str(Path(args.history).resolve())},
+        args.chunk_size,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
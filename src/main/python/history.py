@@ -0,0 +1,96 @@
+"""Record the history of a session: count rates, stage positions, and movements."""
+
+from pathlib import Path
+
+import numpy as np
+
+# kinds of records in the history
+EVENT_SAMPLE = 0  # count rate sample
+EVENT_MOVE = 1  # stage movement
+EVENT_BURST = 2  # stage movement due to a burst
+
+HISTORY_DTYPE = np.dtype(
+    [
+        ("time", np.float64),  # unix time in seconds
+        ("event", np.int8),
+        ("rate", np.float64),  # count rate in cps, NaN for movements
+        ("position", np.float64),  # stage position in degrees
+        ("window_min", np.float32),  # target window in cps
+        ("window_max", np.float32),
+    ]
+)
+
+
+class SessionHistory:
+    """Growable, in-memory record of a session as numpy structured array.
+
+    :param capacity: Initial number of records that can be stored.
+    """
+
+    def __init__(self, capacity: int = 2**16):
+        self._data = np.zeros(capacity, dtype=HISTORY_DTYPE)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def data(self) -> np.ndarray:
+        """Get a view of all records."""
+        return self._data[: self._size]
+
+    def append(
+        self,
+        timestamp: float,
+        event: int,
+        rate: float,
+        position: float,
+        window_min: float,
+        window_max: float,
+    ) -> None:
+        """Append a record, the storage is doubled when it is full.
+
+        :param timestamp: Unix time of the record in seconds.
+        :param event: Kind of the record, e.g., ``EVENT_SAMPLE``.
+        :param rate: Count rate in counts per second, NaN for movements.
+        :param position: Stage position in degrees.
+        :param window_min: Lower limit of the target window in counts per second.
+        :param window_max: Upper limit of the target window in counts per second.
+        """
+        if self._size == self._data.shape[0]:
+            self._data = np.resize(self._data, 2 * self._data.shape[0])
+        self._data[self._size] = (
+            timestamp,
+            event,
+            rate,
+            position,
+            window_min,
+            window_max,
+        )
+        self._size += 1
+
+    def clear(self) -> None:
+        """Remove all records."""
+        self._size = 0
+
+    def save(self, fname: Path) -> None:
+        """Save the history to a ``.npy`` file.
+
+        :param fname: File to save to.
+        """
+        np.save(fname, self.data)
+
+
+def load_history(fname: Path) -> np.ndarray:
+    """Load a saved history, memory mapped.
+
+    :param fname: File to load.
+
+    :return: Records of the history.
+
+    :raises ValueError: The file does not contain a session history.
+    """
+    data = np.load(fname, mmap_mode="r")
+    if data.dtype != HISTORY_DTYPE:
+        raise ValueError(f"{fname} does not contain a session history.")
+    return data
@@ -0,0 +1,172 @@
+"""Measure the latency of the GUI event loop with simulated devices.
+
+The GUI runs headless (offscreen platform) with a fake TDC and a fake rotation
+stage, while the automatic control regulates and count rates are pushed to the
+labels at a high rate. Measured are:
+
+- event loop lag: time from posting an event until it is processed,
+- timer jitter: how late a periodic timer fires compared to its interval,
+- signal to repaint: time from a label update until the label is repainted.
+
+Run it with, e.g.:
+
+    python latency_harness.py --duration 30 --sample-rate 1000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt6 import QtCore, QtWidgets
+
+from main import DesorptionLaserControlGUI
+
+
+class LatencyProbe(QtCore.QObject):
+    """Probe the event loop of a running GUI.
+
+    :param gui: GUI to probe.
+    :param sample_rate: Count rate updates per second pushed to the label.
+    :param timer_interval: Interval of the timer whose jitter is measured (ms).
+    """
+
+    def __init__(
+        self,
+        gui: DesorptionLaserControlGUI,
+        sample_rate: float = 1000.0,
+        timer_interval: int = 100,
+    ):
+        super().__init__()
+        self.gui = gui
+
+        self.loop_lags = []
+        self.timer_lateness = []
+        self.repaint_latencies = []
+        self.num_updates = 0
+        self.num_repaints = 0
+
+        self._last_tick = None
+        self._pending_since = None
+        self._rng = np.random.default_rng()
+
+        self._lag_timer = QtCore.QTimer(self)
+        self._lag_timer.setInterval(20)
+        self._lag_timer.timeout.connect(self._post_event)
+
+        self._jitter_timer = QtCore.QTimer(self)
+        self._jitter_timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self._jitter_timer.setInterval(timer_interval)
+        self._jitter_timer.timeout.connect(self._timer_tick)
+
+        self._sample_timer = QtCore.QTimer(self)
+        self._sample_timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self._sample_timer.setInterval(max(1, int(1000 / sample_rate)))
+        self._sample_timer.timeout.connect(self._push_sample)
+
+        gui.cps_label.installEventFilter(self)
+
+    def eventFilter(self, obj, event) -> bool:
+        """Time stamp the repaints of the count rate label."""
+        if event.type() == QtCore.QEvent.Type.Paint and self._pending_since:
+            self.repaint_latencies.append(time.perf_counter() - self._pending_since)
+            self._pending_since = None
+            self.num_repaints += 1
+        return False
+
+    def start(self) -> None:
+        """Start probing."""
+        self._lag_timer.start()
+        self._jitter_timer.start()
+        self._sample_timer.start()
+
+    def stop(self) -> None:
+        """Stop probing."""
+        self._lag_timer.stop()
+        self._jitter_timer.stop()
+        self._sample_timer.stop()
+
+    def _post_event(self) -> None:
+        """Post an event and measure when it is processed."""
+        posted = time.perf_counter()
+        QtCore.QTimer.singleShot(
+            0, lambda: self.loop_lags.append(time.perf_counter() - posted)
+        )
+
+    def _push_sample(self) -> None:
+        """Push a count rate to the label, as the regulation does."""
+        if self._pending_since is None:
+            self._pending_since = time.perf_counter()
+        self.gui._set_cps_label(self._rng.normal(1000, 30))
+        self.num_updates += 1
+
+    def _timer_tick(self) -> None:
+        """Measure how late the timer fired."""
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            interval = self._jitter_timer.interval() / 1000
+            self.timer_lateness.append(now - self._last_tick - interval)
+        self._last_tick = now
+
+
+def summarize(name: str, values: List[float]) -> str:
+    """Summarize latencies as percentiles in milliseconds.
+
+    :param name: Name of the measurement.
+    :param values: Latencies in seconds.
+
+    :return: One line of text.
+    """
+    if len(values) == 0:
+        return f"{name:<20} no data"
+    p50, p90, p99 = np.percentile(values, (50, 90, 99)) * 1000
+    return (
+        f"{name:<20} n={len(values):<6} p50={p50:7.2f} ms  p90={p90:7.2f} ms  "
+        f"p99={p99:7.2f} ms  max={np.max(values) * 1000:7.2f} ms"
+    )
+
+
+def main(argv=None) -> None:
+    """Run the GUI with simulated devices and print the latencies."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--duration", type=float, default=30.0, help="Duration in seconds."
+    )
+    parser.add_argument(
+        "--sample-rate",
+        type=float,
+        default=1000.0,
+        help="Count rate updates per second pushed to the label.",
+    )
+    parser.add_argument(
+        "--no-auto", action="store_true", help="Do not run the automatic control."
+    )
+    args = parser.parse_args(argv)
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as conf_folder:
+        gui = DesorptionLaserControlGUI(conf_folder=conf_folder, simulate=True)
+        if not args.no_auto:
+            gui.config.set("Adaptive regulation", True)
+            gui.auto_checkbox.setChecked(True)
+
+        probe = LatencyProbe(gui, sample_rate=args.sample_rate)
+        probe.start()
+        QtCore.QTimer.singleShot(int(args.duration * 1000), app.quit)
+        app.exec()
+        probe.stop()
+        gui.close()
+
+    print(summarize("Event loop lag", probe.loop_lags))
+    print(summarize("Timer lateness", probe.timer_lateness))
+    print(summarize("Signal to repaint", probe.repaint_latencies))
+    print(f"Label updates: {probe.num_updates}, repaints: {probe.num_repaints}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,28 +3,64 @@ from PyQt6 import QtCore, QtGui, QtWidgets
 
 import qdarktheme
 
+import multiprocessing
 from pathlib import Path
+import shutil
 import sys
+import time
 from typing import Union
 
-from instruments import units as u
 from pyqtconfig import ConfigManager, ConfigDialog
 import serial.tools.list_ports
 
+from acquisition import ProcessMCS8aComm
 from auto_control import LaserAutoControl
-from power_control import PowerControl
+import analysis
+import discovery
+from events import (
+    MOVE_BURST,
+    MOVE_DOWN,
+    MOVE_STEP,
+    MOVE_UP,
+    Burst,
+    ConfigChanged,
+    EventBus,
+    MoveFinished,
+    MoveRequest,
+    PositionRead,
+    Sample,
+)
+import export
+from history import EVENT_BURST, EVENT_MOVE, EVENT_SAMPLE, load_history
+import metrics
+from power_control import MOTION_FINE, FakePowerControl, PowerControl
 from mcs8a import MCS8aComm, FakeMCS8aComm
+from profiles import LaserProfileRegistry
+from retention import RetentionStore
+from roi import MultiRoiRate, parse_roi_windows
+from scan import BACKLASH_MAX_STEPS, AngleScan
+from spectrum import SpectrumView
+from supervisor import ReconnectSupervisor
 import workers, widgets
 
 
 class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
     """GUI for controlling the desorption laser automatically and by itself."""
 
-    def __init__(self):
-        """Initialize software."""
+    offset_tolerance = 1e-3  # offsets closer than this (deg) are considered equal
+
+    def __init__(self, conf_folder: Path = None, simulate: bool = False):
+        """Initialize software.
+
+        :param conf_folder: Folder of the configuration, defaults to the one in the
+            user's application data.
+        :param simulate: Use a fake TDC and a fake rotation stage, e.g., to
+            measure the latency of the GUI.
+        """
         super(DesorptionLaserControlGUI, self).__init__()
 
         self.use_fake_mcs8a = True
+        self.simulate = simulate
 
         self.version = "0.3.0"
         self.author = "Reto Trappitsch"
@@ -46,6 +82,7 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         self.goto_button = QtWidgets.QPushButton("GoTo")
         self.auto_checkbox = QtWidgets.QCheckBox("Auto control")
         self.cps_label = QtWidgets.QLabel()
+        self.label_updater = widgets.CoalescingUpdater(parent=self)
 
         self.movement_buttons = None
         self._buttons_active = True
@@ -54,16 +91,52 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         self.config = None
         self.laser_settings = None
         self.laser_settings_metadata = None
-        self.conf_folder = Path.home().joinpath(
-            "AppData/Roaming/DesorptionLaserControl/"
-        )
+        if conf_folder is None:
+            conf_folder = Path.home().joinpath(
+                "AppData/Roaming/DesorptionLaserControl/"
+            )
+        self.conf_folder = Path(conf_folder)
         self.laser_conf_folder = self.conf_folder.joinpath("lasers/")
+        self.laser_profiles = LaserProfileRegistry(self.laser_conf_folder)
+        self.laser_profiles_menu = None
+        self.sessions_folder = self.conf_folder.joinpath("sessions/")
+        self.session_start = time.time()
 
         # communication
         self.mcs8a = None
         self.power = None
+        self.stage = None
         self._power_curr_position = None
+        self._power_curr_offset = None
         self.auto_control = None
+        self.angle_scan = None
+        self.spectrum_dialog = None
+
+        # history of the session for the regulation statistics, in constant memory
+        self.history = RetentionStore()
+
+        # events of the automatic control, the stage, and the configuration
+        self.bus = EventBus()
+        self.bus.subscribe(Sample, self.samples_received)
+        self.bus.subscribe(MoveRequest, self.move_requests_received)
+
+        # watchdog for the acquisition process
+        self.mcs8a_watchdog = QtCore.QTimer()
+        self.mcs8a_watchdog.timeout.connect(self.mcs8a_check)
+
+        # automatic reconnection of failed devices
+        self._stage_restore = None  # state to restore after reconnecting the stage
+        self._mcs8a_restore = None  # DLL path and process flag to reconnect the TDC
+        self.supervisor = ReconnectSupervisor(self.threadpool)
+        self.supervisor.register("stage", self.stage_reconnect, self.stage_recovered)
+        self.supervisor.register("tdc", self.mcs8a_reconnect, self.mcs8a_recovered)
+        self.supervisor.recovered.connect(self.device_recovered)
+        self.supervisor.attempt_failed.connect(self.device_reconnect_failed)
+
+        # metrics export
+        self.metrics_server = None
+        self.metrics_timer = QtCore.QTimer()
+        self.metrics_timer.timeout.connect(self.metrics_write_textfile)
 
         # window stuff and version
         self.title = "Desorption Laser Control, v" + self.version
@@ -77,6 +150,7 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         # init all
         self.init_configuration()
         self.init_laser_config()
+        self.init_metrics()
         self.init_comms()
         self.init_menubar()
         self.init_ui()
@@ -85,6 +159,13 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
 
     def init_comms(self):
         """Initialize comms."""
+        if self.simulate:
+            self.stage_thread_stop()
+            self.mcs8a = FakeMCS8aComm()
+            self.power = FakePowerControl()
+            self.init_stage_thread()
+            return
+
         if self.config.get("Port") is None:
             QtWidgets.QMessageBox.warning(
                 self,
@@ -106,10 +187,18 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
                     "Please select a valid MCS8a DLL in the settings.",
                 )
         else:
-            self.mcs8a = MCS8aComm(dllpath=self.config.get("MCS8a DLL"))
+            self.mcs8a_stop()
+            if self.config.get("Separate acquisition process"):
+                self.mcs8a = ProcessMCS8aComm(dllpath=self.config.get("MCS8a DLL"))
+                self.mcs8a_watchdog.start(1000)
+            else:
+                self.mcs8a = MCS8aComm(dllpath=self.config.get("MCS8a DLL"))
+
+        self.stage_thread_stop()
+        self.power_close()
 
         try:
-            self.power = PowerControl(self.config.get("Port"), gui=self)
+            self.power = PowerControl(self.stage_port_find())
         except TimeoutError:
             QtWidgets.QMessageBox.warning(
                 self,
@@ -135,8 +224,22 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
             )
             return
 
-        # get current position
+        self.init_stage_thread()
+
+    def init_stage_thread(self):
+        """Start the stage thread, through which all stage communication goes."""
+        self.stage = workers.StageThread(self.power)
+        self.stage.signals.error.connect(self.move_stage_error)
+        self.stage.signals.connection_lost.connect(self.stage_connection_lost)
+        self.stage.signals.movement_finished.connect(self.move_stage_finished)
+        self.stage.signals.position_read.connect(self.power_curr_position_update)
+        self.stage.signals.offset_read.connect(self.power_curr_offset_update)
+        self.stage.start()
+
+        # get current position and offset
         self.power_curr_position_read()
+        self.stage.read_offset()
+        self.laser_settings_set_backlash()
 
     def init_configuration(self):
         """Create / initialize local configuration."""
@@ -144,6 +247,8 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
 
         default_settings = {
             "Port": None,
+            "Stage serial": 0,
+            "Stage ports": {},
             "man_step": 0.1,
             "MCS8a DLL": "C:\Windows\System32\DMCS8.DLL",
             "Power up (deg)": 0.1,
@@ -152,15 +257,28 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
             "ROI Min (cps)": 500,
             "ROI Max (cps)": 1500,
             "ROI burst (cps)": 2000,
+            "ROI windows (us)": "",
+            "Regulate on ROI": "",
             "Regulate every (s)": 3,
+            "Adaptive regulation": False,
+            "Confidence (sigma)": 2.0,
+            "Sweeps per regulation": 0,
+            "Predictive regulation": False,
+            "Prediction window (s)": 120,
+            "Max predictive step (deg)": 1.0,
             "TDC Channel": 1,
             "Display Precision": 2,
             "GUI Theme": "light",
+            "Separate acquisition process": True,
+            "Metrics port": 0,
+            "Metrics textfile": "",
             "laser_config": "default.json",
         }
 
         metadata = {
             "Port": {"prefer_hidden": True},
+            "Stage serial": {"prefer_hidden": True},
+            "Stage ports": {"prefer_hidden": True},
             "man_step": {"prefer_hidden": True},
             "ROI Min (cps)": {"preferred_handler": widgets.LargeQSpinBox},
             "ROI Max (cps)": {"preferred_handler": widgets.LargeQSpinBox},
@@ -170,6 +288,9 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
                 "preferred_handler": QtWidgets.QComboBox,
                 "preferred_map_dict": {"Dark": "dark", "Light": "light"},
             },
+            "Sweeps per regulation": {"preferred_handler": widgets.LargeQSpinBox},
+            "Prediction window (s)": {"preferred_handler": widgets.LargeQSpinBox},
+            "Metrics port": {"preferred_handler": widgets.PortQSpinBox},
             "TDC Channel": {"prefer_hidden": True},  # fixme
             "laser_config": {"prefer_hidden": True},
         }
@@ -193,6 +314,9 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
             "Write offset to stage & home": False,
             "Zero offset (deg)": 0.0,
             "Current zero offset (deg)": 0.0,
+            "Scan angles (deg)": [],
+            "Scan rates (cps)": [],
+            "Backlash (deg)": 0.0,
         }
 
         metadata = {
@@ -202,11 +326,41 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
             "Current zero offset (deg)": {
                 "preferred_handler": widgets.ReadOnlyQDoubleSpinBox
             },
+            "Scan angles (deg)": {"prefer_hidden": True},
+            "Scan rates (cps)": {"prefer_hidden": True},
+            "Backlash (deg)": {"preferred_handler": widgets.BacklashQDoubleSpinBox},
         }
         self.laser_settings_metadata = metadata
 
         self.laser_settings_config_manager(default_lconf, lconf_file, metadata)
         self.laser_settings.save()
+        self.laser_profiles.refresh()
+
+    def init_metrics(self):
+        """Start / stop the metrics export according to the configuration.
+
+        A metrics port of zero disables the HTTP endpoint, an empty file name
+        disables the text file. An invalid port, e.g., from an edited configuration
+        file, is reported and disables the HTTP endpoint.
+        """
+        port = self.config.get("Metrics port")
+        if self.metrics_server is not None and self.metrics_server.port != port:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.metrics_server is None and port > 0:
+            try:
+                self.metrics_server = metrics.MetricsServer(port)
+            except (OSError, OverflowError) as err:  # port taken / out of range
+                QtWidgets.QMessageBox.warning(
+                    self,
+                    "Metrics export",
+                    f"Could not start the metrics server on port {port}: {err}",
+                )
+
+        if self.config.get("Metrics textfile").strip() != "":
+            self.metrics_timer.start(5000)
+        else:
+            self.metrics_timer.stop()
 
     def init_menubar(self):
         """Set up the menu bar."""
@@ -234,9 +388,31 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
 
         stage_menu_home = QtGui.QAction("Home Stage", self)
         stage_menu_home.setToolTip("Home the Stage and set to zero.")
-        stage_menu_home.triggered.connect(self.home)
+        stage_menu_home.triggered.connect(lambda: self.home())
         stage_menu.addAction(stage_menu_home)
 
+        stage_menu_scan = QtGui.QAction("Angle Scan", self)
+        stage_menu_scan.setToolTip(
+            "Sweep the stage between the limits and record the count rate."
+        )
+        stage_menu_scan.triggered.connect(lambda: self.angle_scan_start())
+        stage_menu.addAction(stage_menu_scan)
+
+        stage_menu_backlash = QtGui.QAction("Calibrate Backlash", self)
+        stage_menu_backlash.setToolTip(
+            "Sweep the stage up and down and determine the backlash from the shift "
+            "of the count rate curves."
+        )
+        stage_menu_backlash.triggered.connect(
+            lambda: self.angle_scan_start(bidirectional=True)
+        )
+        stage_menu.addAction(stage_menu_backlash)
+
+        stage_menu_scan_show = QtGui.QAction("Show Angle Scan", self)
+        stage_menu_scan_show.setToolTip("Show the last angle scan of this laser.")
+        stage_menu_scan_show.triggered.connect(self.angle_scan_show)
+        stage_menu.addAction(stage_menu_scan_show)
+
         stage_menu_conf = QtGui.QAction("Configure Stage", self)
         stage_menu_conf.setToolTip("Configure the given stage for a specific laser.")
         stage_menu_conf.triggered.connect(self.laser_settings_dialog)
@@ -248,6 +424,41 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         stage_menu_load.triggered.connect(self.laser_settings_load)
         stage_menu.addAction(stage_menu_load)
 
+        self.laser_profiles_menu = stage_menu.addMenu("Switch Laser")
+        self.laser_profiles_menu.setToolTipsVisible(True)
+        self.laser_profiles_menu.aboutToShow.connect(self.laser_profiles_menu_update)
+
+        # Analysis Menu
+        analysis_menu = self.menubar.addMenu("&Analysis")
+
+        analysis_menu_stats = QtGui.QAction("Regulation Statistics", self)
+        analysis_menu_stats.setToolTip("Analyze the regulation of this session.")
+        analysis_menu_stats.triggered.connect(self.history_analyze)
+        analysis_menu.addAction(analysis_menu_stats)
+
+        analysis_menu_spectrum = QtGui.QAction("Live Spectrum", self)
+        analysis_menu_spectrum.setToolTip("Show the spectrum while it builds up.")
+        analysis_menu_spectrum.triggered.connect(self.spectrum_show)
+        analysis_menu.addAction(analysis_menu_spectrum)
+        analysis_menu.addSeparator()
+
+        analysis_menu_save = QtGui.QAction("Save Session", self)
+        analysis_menu_save.setToolTip("Save the history of this session.")
+        analysis_menu_save.triggered.connect(self.history_save)
+        analysis_menu.addAction(analysis_menu_save)
+
+        analysis_menu_export = QtGui.QAction("Export Session", self)
+        analysis_menu_export.setToolTip(
+            "Export the history of this session to HDF5 or Parquet."
+        )
+        analysis_menu_export.triggered.connect(self.history_export)
+        analysis_menu.addAction(analysis_menu_export)
+
+        analysis_menu_open = QtGui.QAction("Analyze Session File", self)
+        analysis_menu_open.setToolTip("Analyze the regulation of a saved session.")
+        analysis_menu_open.triggered.connect(self.history_analyze_file)
+        analysis_menu.addAction(analysis_menu_open)
+
         # Settings Menu
         settings_menu = self.menubar.addMenu("Settings")
 
@@ -419,11 +630,36 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         config_dialog.exec()
 
     def config_rotation_stage(self):
-        """Have user configure / select the COM port for rotation stage."""
-        ports = serial.tools.list_ports.comports()
-        ports_list = []
-        for port, desc, hwid in sorted(ports):
-            ports_list.append(f"{port}: {desc} [{hwid}]")
+        """Have user configure / select the COM port for rotation stage.
+
+        The ports with the USB IDs of APT controllers are probed first, all ports
+        only if the user agrees. If controllers were found, only these are offered
+        and the serial number of the selected one is stored, such that its port is
+        found again automatically. Otherwise, all ports are offered.
+        """
+        self.stage_thread_stop()
+        self.power_close()  # our own stage would not answer the probe otherwise
+        stages = discovery.discover_stages()
+        if not stages:
+            answer = QtWidgets.QMessageBox.question(
+                self,
+                "No rotation stage found",
+                "No Thorlabs APT controller was found by its USB ID. Probe all "
+                "serial ports? This sends a request to every serial device.",
+            )
+            if answer == QtWidgets.QMessageBox.StandardButton.Yes:
+                stages = discovery.discover_stages(all_ports=True)
+
+        if stages:
+            ports_list = [
+                f"{stage.port}: {stage.model} (S/N {stage.serial_number})"
+                for stage in stages
+            ]
+        else:
+            ports = serial.tools.list_ports.comports()
+            ports_list = []
+            for port, desc, hwid in sorted(ports):
+                ports_list.append(f"{port}: {desc} [{hwid}]")
 
         item, ok = QtWidgets.QInputDialog.getItem(
             self, "Select port of Rotation Stage", "Ports", ports_list, 0, False
@@ -431,6 +667,14 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
 
         if ok and item:
             self.config.set("Port", item.split(":")[0])
+            if stages:
+                stage = stages[ports_list.index(item)]
+                cache = dict(self.config.get("Stage ports"))
+                cache.update({str(it.serial_number): it.port for it in stages})
+                self.config.set("Stage ports", cache)
+                self.config.set("Stage serial", stage.serial_number)
+            else:
+                self.config.set("Stage serial", 0)
         self.config.save()
         self.init_comms()
 
@@ -439,24 +683,281 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         self.config.set_many(update.as_dict())
         self._set_theme()
         self.config.save()
+        self.init_metrics()
+        self.bus.publish(ConfigChanged(time.time(), "config", self.config.as_dict()))
 
     def goto(self):
         """Goto a user set position."""
         pos = self.set_position.value()
         self.move_stage(pos, absolute=True)
 
-    def home(self):
-        """Home the stage."""
-        timeout = self.power.ch.motion_timeout
-        self.power.ch.motion_timeout = 100 * u.sec
-        self.power.ch.go_home()
-        self.power.ch.motion_timeout = timeout
-        self.power_curr_position_read()
+    def angle_scan_start(self, bidirectional: bool = False):
+        """Start a continuous angle scan between the limits of the laser.
+
+        :param bidirectional: Sweep back down to calibrate the backlash.
+        """
+        if self.stage is None or self.mcs8a is None:
+            QtWidgets.QMessageBox.warning(
+                self, "Not initialized", "Please initialize the devices first."
+            )
+            return
+
+        self.mcs8a.active_channel = self.config.get("TDC Channel") - 1
+        if not self.mcs8a.is_measuring:
+            QtWidgets.QMessageBox.warning(
+                self, "Not measuring", "Please start the acquisition on the TDC."
+            )
+            return
+
+        roi_name = self.config.get("Regulate on ROI").strip()
+        roi_rates = None
+        if roi_name != "":
+            try:
+                roi_rates = self.roi_rates_create(roi_name)
+            except ValueError as err:
+                QtWidgets.QMessageBox.warning(self, "Invalid ROI", err.args[0])
+                return
+
+        # the backlash is calibrated with slow sweeps and must be smaller than a few
+        # regulation steps, larger estimates are artifacts, e.g., of a drifting rate
+        max_backlash = BACKLASH_MAX_STEPS * max(
+            self.config.get("Power up (deg)"), self.config.get("Power down (deg)")
+        )
+        self.stage_command_start()
+        self.angle_scan = AngleScan(
+            self.stage,
+            self.mcs8a,
+            self.laser_settings.get("Lower limit (deg)"),
+            self.laser_settings.get("Upper limit (deg)"),
+            roi_rates=roi_rates,
+            roi_name=roi_name,
+            bidirectional=bidirectional,
+            profile=MOTION_FINE if bidirectional else None,
+            max_backlash=max_backlash if bidirectional else None,
+        )
+        self.angle_scan.finished.connect(self.angle_scan_finished)
+        self.angle_scan.start()
+
+    def angle_scan_finished(self, angles, rates):
+        """Save the angle scan with the laser settings and show it.
+
+        :param angles: Angles of the scan in degrees.
+        :param rates: Count rates of the scan in counts per second.
+        """
+        bidirectional = self.angle_scan.bidirectional
+        backlash = self.angle_scan.backlash
+        backlash_estimate = self.angle_scan.backlash_estimate
+        max_backlash = self.angle_scan.max_backlash
+        self.angle_scan = None
+        if angles.shape[0] == 0:
+            QtWidgets.QMessageBox.warning(
+                self, "Angle scan failed", "No count rates were recorded."
+            )
+            return
+
+        self.laser_settings.set("Scan angles (deg)", angles.tolist())
+        self.laser_settings.set("Scan rates (cps)", rates.tolist())
+        if backlash is not None:
+            self.laser_settings.set("Backlash (deg)", backlash)
+        self.laser_settings.save()
+        self.laser_profiles.update(
+            self.laser_profile_name, self.laser_settings.as_dict()
+        )
+
+        if bidirectional:
+            if backlash is None and backlash_estimate is not None:
+                QtWidgets.QMessageBox.warning(
+                    self,
+                    "Backlash calibration failed",
+                    f"The estimated backlash of {backlash_estimate:.3f}\u00b0 is "
+                    f"larger than {max_backlash:.3f}\u00b0 ({BACKLASH_MAX_STEPS} "
+                    "regulation steps) and was rejected. Please check that the "
+                    "count rate is stable and repeat the calibration.",
+                )
+            elif backlash is None:
+                QtWidgets.QMessageBox.warning(
+                    self,
+                    "Backlash calibration failed",
+                    "The count rate curves of the two sweeps do not overlap.",
+                )
+            else:
+                self.laser_settings_set_backlash()
+                QtWidgets.QMessageBox.information(
+                    self, "Backlash calibrated", f"Backlash: {backlash:.3f}\u00b0"
+                )
+            return
+        self.angle_scan_show()
+
+    def angle_scan_show(self):
+        """Show the angle scan that is saved with the laser settings."""
+        angles = self.laser_settings.get("Scan angles (deg)")
+        rates = self.laser_settings.get("Scan rates (cps)")
+        if not angles:
+            QtWidgets.QMessageBox.information(
+                self, "No angle scan", "No angle scan was recorded for this laser."
+            )
+            return
+
+        plot = widgets.LinePlot(xlabel="Angle (deg)", ylabel="cps")
+        plot.set_data(angles, rates)
+
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(f"Angle Scan: {self.laser_settings.get('Laser Name')}")
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(plot)
+        dialog.setLayout(layout)
+        dialog.exec()
+
+    def closeEvent(self, event: QtGui.QCloseEvent) -> None:
+        """Stop the stage thread before closing."""
+        self.stage_thread_stop()
+        self.mcs8a_stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if len(self.history) > 0:
+            try:
+                self.history_save()
+            except OSError:
+                pass  # do not prevent closing
+        event.accept()
+
+    def history_analyze(self):
+        """Show the regulation statistics of the current session."""
+        if len(self.history) < 2:
+            QtWidgets.QMessageBox.information(
+                self, "No history", "No count rates were recorded in this session."
+            )
+            return
+        self.history_show(self.history.records(), "Regulation Statistics")
+
+    def history_analyze_file(self):
+        """Show the regulation statistics of a saved session."""
+        fname, _ = QtWidgets.QFileDialog.getOpenFileName(
+            self,
+            "Open session history",
+            str(self.sessions_folder),
+            "Session history (*.npy)",
+        )
+        if fname == "":
+            return
+
+        try:
+            data = load_history(fname)
+        except (OSError, ValueError) as err:
+            QtWidgets.QMessageBox.warning(self, "Invalid session history", str(err))
+            return
+        self.history_show(data, f"Regulation Statistics: {Path(fname).stem}")
+
+    def history_export(self):
+        """Export the history of this session in the background.
+
+        The export runs in the thread pool and writes the records that exist when
+        it starts, the control loop keeps on recording meanwhile.
+        """
+        fname, file_filter = QtWidgets.QFileDialog.getSaveFileName(
+            self,
+            "Export session history",
+            str(self.sessions_folder),
+            "HDF5 (*.h5);;Parquet (*.parquet)",
+        )
+        if fname == "":
+            return
+        if Path(fname).suffix == "":
+            fname += ".parquet" if "parquet" in file_filter else ".h5"
+
+        metadata = {
+            "version": self.version,
+            "session_start": self.session_start,
+            "laser_profile": self.laser_profile_name,
+            "laser_settings": self.laser_settings.as_dict(),
+            "configuration": self.config.as_dict(),
+        }
+        worker = workers.Worker(
+            export.export_history, self.history.records(), fname, metadata
+        )
+        worker.signals.finished.connect(
+            lambda: self.statusBar().showMessage(
+                f"Session history exported to {fname}.", 5000
+            )
+        )
+        worker.signals.error.connect(
+            lambda msg: QtWidgets.QMessageBox.warning(self, "Export failed", msg)
+        )
+        self.threadpool.start(worker)
+
+    def history_record(
+        self,
+        event: int,
+        rate: float = float("nan"),
+        timestamp: float = None,
+        position: float = None,
+    ) -> None:
+        """Record a count rate sample or a movement in the session history.
+
+        :param event: Kind of the record, see ``history``.
+        :param rate: Count rate in counts per second, NaN for movements.
+        :param timestamp: Unix time of the record in seconds, now if not given.
+        :param position: Stage position in degrees, the current one if not given.
+        """
+        if position is None:
+            position = self.power_curr_position
+        self.history.append(
+            time.time() if timestamp is None else timestamp,
+            event,
+            rate,
+            float("nan") if position is None else position,
+            self.config.get("ROI Min (cps)"),
+            self.config.get("ROI Max (cps)"),
+        )
+
+    def history_save(self) -> Path:
+        """Save the history of this session to the sessions folder.
+
+        :return: File the history was saved to.
+        """
+        self.sessions_folder.mkdir(parents=True, exist_ok=True)
+        fname = self.sessions_folder.joinpath(
+            time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime(self.session_start))
+        ).with_suffix(".npy")
+        self.history.save(fname)
+        self.statusBar().showMessage(f"Session history saved to {fname}.", 5000)
+        return fname
+
+    def history_show(self, data, title: str):
+        """Analyze a session history and show the summary.
+
+        :param data: Records of the session history.
+        :param title: Title of the dialog.
+        """
+        summary = analysis.format_summary(analysis.analyze(data))
+        QtWidgets.QMessageBox.information(self, title, summary)
+
+    def home(self, offset: float = None):
+        """Home the stage.
+
+        :param offset: Zero offset in degrees to write to the stage before homing.
+        """
+        if self.stage is None:  # being reconnected
+            return
+        self.stage_command_start()
+        if offset is not None:
+            self._power_curr_offset = offset  # updated again after homing
+        self.stage.home(offset=offset)
 
     def laser_control(self):
         """Automatic control."""
         # turn on:
         if self.auto_checkbox.isChecked():
+            roi_name = self.config.get("Regulate on ROI").strip()
+            roi_rates = None
+            if roi_name != "":
+                try:
+                    roi_rates = self.roi_rates_create(roi_name)
+                except ValueError as err:
+                    QtWidgets.QMessageBox.warning(self, "Invalid ROI", err.args[0])
+                    self.auto_checkbox.setChecked(False)
+                    return
+
             self.auto_control = LaserAutoControl(
                 self,
                 self.power,
@@ -466,13 +967,43 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
                 self.config.get("ROI Max (cps)"),
                 self.config.get("ROI burst (cps)"),
                 self.config.get("TDC Channel"),
+                roi_rates=roi_rates,
+                roi_name=roi_name,
+                adaptive=self.config.get("Adaptive regulation"),
+                confidence=self.config.get("Confidence (sigma)"),
+                sweeps_per_block=self.config.get("Sweeps per regulation"),
+                predictive=self.config.get("Predictive regulation"),
+                predict_window=self.config.get("Prediction window (s)"),
+                max_step=self.config.get("Max predictive step (deg)"),
+                bus=self.bus,
+                position=(
+                    float("nan")
+                    if self.power_curr_position is None
+                    else self.power_curr_position
+                ),
             )
             self.auto_control.activate()
         else:  # turn off
             if self.auto_control is not None:
                 self.auto_control.deactivate()
+                self.auto_control.close()
+                self._set_cps_label(None)
             self.auto_control = None
 
+    def roi_rates_create(self, roi_name: str) -> MultiRoiRate:
+        """Create a multi ROI rate calculator from the configured ROI windows.
+
+        :param roi_name: Name of the ROI that will be regulated on.
+
+        :return: Multi ROI rate calculator.
+
+        :raises ValueError: ROI windows are invalid or ROI name is not defined.
+        """
+        windows = parse_roi_windows(self.config.get("ROI windows (us)"))
+        if roi_name not in (window.name for window in windows):
+            raise ValueError(f"ROI {roi_name} is not defined in the ROI windows.")
+        return MultiRoiRate(windows, self.mcs8a.bin_width)
+
     def laser_settings_config_manager(
         self, conf: dict, fname: str, metadata: dict = None
     ):
@@ -494,8 +1025,10 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
 
     def laser_settings_dialog(self):
         """Execute the config dialog."""
-        current_offset = self.power.offset.magnitude
-        self.laser_settings.set("Current zero offset (deg)", current_offset)
+        if self._power_curr_offset is not None:
+            self.laser_settings.set(
+                "Current zero offset (deg)", self._power_curr_offset
+            )
 
         self.laser_settings.set("Write offset to stage & home", False)
 
@@ -507,7 +1040,11 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         laser_settings_dialog.exec()
 
     def laser_settings_load(self) -> None:
-        """Load an existing laser settings file."""
+        """Load an existing laser settings file.
+
+        A file outside the laser configuration folder is imported into it, such that
+        every laser profile is identified by the stem of its file name.
+        """
         fname = QtWidgets.QFileDialog.getOpenFileName(
             self,
             "Open Laser Settings",
@@ -518,33 +1055,113 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         if fname == "":
             return
 
-        self.laser_settings_config_manager(self.laser_settings.as_dict(), fname)
+        fname = Path(fname)
+        name = fname.stem
+        if fname.parent.resolve() != self.laser_conf_folder.resolve():
+            target = self.laser_profiles.path(name)
+            if target.exists():
+                answer = QtWidgets.QMessageBox.question(
+                    self,
+                    "Laser profile exists",
+                    f"A laser profile {name} exists already. Overwrite it?",
+                )
+                if answer != QtWidgets.QMessageBox.StandardButton.Yes:
+                    return
+            try:
+                shutil.copyfile(fname, target)
+            except OSError as err:
+                QtWidgets.QMessageBox.warning(
+                    self, "Laser profile not imported", f"{fname}: {err}"
+                )
+                return
+
+        self.laser_profiles.refresh()
+        if name not in self.laser_profiles.names:
+            QtWidgets.QMessageBox.warning(
+                self,
+                "Invalid laser profile",
+                f"{fname} is not a valid laser settings file.",
+            )
+            return
+        self.laser_profile_switch(name)
+
+    def laser_profile_switch(self, name: str) -> None:
+        """Switch to a laser profile from the registry.
+
+        The stage is only re-homed if the zero offset of the profile differs from
+        the one currently set on the stage.
+
+        :param name: Name of the profile.
+        """
+        settings = self.laser_settings.as_dict()
+        settings.update(self.laser_profiles.get(name))
+        self.laser_settings_config_manager(settings, self.laser_profiles.path(name))
         self.laser_settings_set_offset(force=True)
-        self.config.set("laser_config", self.laser_settings.get("Laser Name"))
+        self.laser_settings_set_backlash()
+        self.config.set("laser_config", name)
         self.config.save()
 
+    @property
+    def laser_profile_name(self) -> str:
+        """Get the name of the current laser profile, the stem of its file name."""
+        return Path(self.config.get("laser_config")).stem
+
+    def laser_profiles_menu_update(self) -> None:
+        """Fill the menu to switch laser profiles with all available profiles."""
+        self.laser_profiles_menu.clear()
+        current = self.laser_profile_name
+        for name in self.laser_profiles.refresh():
+            action = QtGui.QAction(name, self)
+            action.setCheckable(True)
+            action.setChecked(name == current)
+            action.triggered.connect(lambda _, it=name: self.laser_profile_switch(it))
+            self.laser_profiles_menu.addAction(action)
+
     def laser_settings_update(self, update):
         """Update the configuration."""
-        laser_name = update.as_dict()["Laser Name"]
-        self.config.set("laser_config", laser_name)
+        fname = self.laser_profiles.path(update.as_dict()["Laser Name"])
+        self.config.set("laser_config", fname.stem)
         self.config.save()
 
-        fname = self.laser_conf_folder.joinpath(laser_name).with_suffix(".json")
         self.laser_settings_config_manager(self.laser_settings.as_dict(), fname)
         self.laser_settings.set_many(update.as_dict())
+        # one-shot action, must not be stored with the profile
+        write_offset = self.laser_settings.get("Write offset to stage & home")
+        self.laser_settings.set("Write offset to stage & home", False)
         self.laser_settings.save()
-        self.laser_settings_set_offset()
+        self.laser_profiles.update(fname.stem, self.laser_settings.as_dict())
+        self.laser_settings_set_offset(write=write_offset)
+        self.laser_settings_set_backlash()
+        self.bus.publish(
+            ConfigChanged(time.time(), "laser", self.laser_settings.as_dict())
+        )
 
-    def laser_settings_set_offset(self, force: bool = False):
-        """Look at laser settings and set offset, if required by user.
+    def laser_settings_set_backlash(self):
+        """Set the backlash model of the laser settings on the stage."""
+        if self.stage is None:
+            return
+        self.stage.submit(
+            workers.StagePriority.MANUAL,
+            self.power.set_backlash_model,
+            self.laser_settings.get("Backlash (deg)"),
+        )
 
-        :param force: Force the writing of the parameters and homing?
+    def laser_settings_set_offset(self, force: bool = False, write: bool = False):
+        """Write the offset of the laser settings to the stage and home it.
+
+        :param force: Write the offset and home the stage if the offset differs from
+            the one that is currently set on the stage. This is used when another
+            laser profile is loaded.
+        :param write: Write the offset and home the stage in any case, as requested
+            by the user with "Write offset to stage & home".
         """
-        write_it = self.laser_settings.get("Write offset to stage & home")
         user_offset = self.laser_settings.get("Zero offset (deg)")
-        if write_it or force:
-            self.power.offset = user_offset
-            self.home()
+        offset_differs = (
+            self._power_curr_offset is None
+            or abs(self._power_curr_offset - user_offset) > self.offset_tolerance
+        )
+        if write or (force and offset_differs):
+            self.home(offset=user_offset)
 
     def auto_decrease(self):
         """Decrease by automatic step."""
@@ -559,6 +1176,13 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         step = self.config.get("Power up (deg)")
         self.move_stage(step, absolute=False, is_auto=True)
 
+    def auto_step(self, step: float):
+        """Move by a step of the predictive control.
+
+        :param step: Step in degrees, positive to increase the power.
+        """
+        self.move_stage(step, absolute=False, is_auto=True)
+
     def manual_decrease(self):
         """Decrease by manual step."""
         step = self.manual_step_edit.value()
@@ -567,7 +1191,7 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
     def manual_burst_decrease(self, is_auto=False):
         """Decrease fast by manual burst step."""
         step = self.config.get("Power down fast (deg)")
-        self.move_stage(-step, absolute=False, is_auto=True)
+        self.move_stage(-step, absolute=False, is_auto=True, is_burst=True)
 
     def manual_increase(self):
         """Increase by manual step."""
@@ -575,25 +1199,35 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         self.move_stage(step, absolute=False)
 
     def move_stage(
-        self, val: float, absolute: bool = True, is_auto: bool = False
+        self,
+        val: float,
+        absolute: bool = True,
+        is_auto: bool = False,
+        is_burst: bool = False,
     ) -> None:
         """Move stage to an absolute value in degrees.
 
         During movement, the whole widget is deactivated and subsequently reactivated.
+        The movement is queued on the stage thread, burst decreases have the highest
+        priority, followed by automatic and manual movements.
 
         :param val: Value to do got in degrees.
         :param absolute: Absolute move or not?
         :param is_auto: If we come from auto control, we don't want to turn it off.
+        :param is_burst: Is this a burst decrease?
         """
-        # turn off auto control
-        if isinstance(self.auto_control, LaserAutoControl) and not is_auto:
-            self.auto_control.deactivate()
+        if self.stage is None:  # being reconnected, auto control stays paused
+            return
+        if self.power_curr_position is None:  # position not read yet
+            self.power_curr_position_read()
+            if is_auto and isinstance(self.auto_control, LaserAutoControl):
+                self.auto_control.activate()  # do not wait for a move forever
+            return
 
-        self.controls_active = False
-        self.auto_checkbox.setEnabled(False)
+        self.stage_command_start(is_auto=is_auto)
 
         # check limits
-        new_position = self.power_curr_position + val
+        new_position = val if absolute else self.power_curr_position + val
         if new_position < (limit := self.laser_settings.get("Lower limit (deg)")):
             val = limit
             absolute = True
@@ -601,11 +1235,133 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
             val = limit
             absolute = True
 
-        # thread out movement
-        worker = workers.Worker(self.power.ch.move, val * u.degree, absolute=absolute)
-        worker.signals.error.connect(self.move_stage_error)
-        worker.signals.movement_finished.connect(self.move_stage_finished)
-        self.threadpool.start(worker)
+        metrics.MOVES.inc()
+        metrics.MOVES_PER_MINUTE.event()
+        self.history_record(EVENT_BURST if is_burst else EVENT_MOVE)
+        if is_burst:
+            self.bus.publish(Burst(time.time(), self.power_curr_position))
+            metrics.BURSTS.inc()
+            priority = workers.StagePriority.BURST
+        elif is_auto:
+            priority = workers.StagePriority.AUTO
+        else:
+            priority = workers.StagePriority.MANUAL
+        self.stage.move(val, absolute, priority)
+
+    def mcs8a_check(self):
+        """Reconnect the TDC if the acquisition process stalled."""
+        if isinstance(self.mcs8a, ProcessMCS8aComm) and self.mcs8a.is_stalled:
+            self.mcs8a_connection_lost("acquisition process stalled")
+
+    def mcs8a_connection_lost(self, msg: str = "") -> None:
+        """Close the broken TDC and reconnect it in the background.
+
+        :param msg: Error message of the failure.
+        """
+        if self.supervisor.is_recovering("tdc"):
+            return
+        self.statusBar().showMessage(
+            f"Connection to the TDC lost ({msg}), reconnecting..."
+        )
+        if self.spectrum_dialog is not None:
+            self.spectrum_dialog.hide()
+        self._mcs8a_restore = (
+            self.config.get("MCS8a DLL"),
+            isinstance(self.mcs8a, ProcessMCS8aComm),
+        )
+        self.mcs8a_stop()
+        self.mcs8a = None
+        if isinstance(self.auto_control, LaserAutoControl):
+            self.auto_control.mcs8a = None  # waits until the TDC is back
+        self.supervisor.device_failed("tdc")
+
+    def mcs8a_reconnect(self) -> Union[MCS8aComm, ProcessMCS8aComm]:
+        """Connect the TDC again, runs in the thread pool.
+
+        :return: Connected TDC.
+
+        :raises TimeoutError: The acquisition process did not deliver a sample.
+        """
+        dllpath, separate_process = self._mcs8a_restore
+        if separate_process:
+            comm = ProcessMCS8aComm(dllpath=dllpath)
+            if not comm.wait_ready():
+                comm.stop()
+                raise TimeoutError("The TDC acquisition process did not start.")
+        else:
+            comm = MCS8aComm(dllpath=dllpath)
+            comm.is_measuring  # raises if the DLL does not answer
+        return comm
+
+    def mcs8a_recovered(self, comm: Union[MCS8aComm, ProcessMCS8aComm]) -> None:
+        """Use the reconnected TDC everywhere the broken one was used."""
+        self.mcs8a = comm
+        self.mcs8a.active_channel = self.config.get("TDC Channel") - 1
+        if isinstance(comm, ProcessMCS8aComm):
+            self.mcs8a_watchdog.start(1000)
+        if isinstance(self.auto_control, LaserAutoControl):
+            self.auto_control.mcs8a = comm
+
+    def mcs8a_stop(self):
+        """Stop the acquisition process, if one is running."""
+        self.mcs8a_watchdog.stop()
+        if isinstance(self.mcs8a, ProcessMCS8aComm):
+            self.mcs8a.stop()
+            self.mcs8a = None
+
+    def metrics_write_textfile(self):
+        """Write the metrics to the configured text file."""
+        try:
+            metrics.write_textfile(self.config.get("Metrics textfile").strip())
+        except OSError:
+            self.metrics_timer.stop()
+            QtWidgets.QMessageBox.warning(
+                self, "Metrics export", "Could not write the metrics text file."
+            )
+
+    def device_recovered(self, name: str, duration: float) -> None:
+        """Report that a device was reconnected.
+
+        :param name: Name of the device, see ``ReconnectSupervisor``.
+        :param duration: Time from the failure until the reconnection in seconds.
+        """
+        device = "Rotation stage" if name == "stage" else "TDC"
+        self.statusBar().showMessage(
+            f"{device} reconnected after {duration:.1f} s.", 10000
+        )
+
+    def device_reconnect_failed(
+        self, name: str, attempts: int, delay: float, msg: str
+    ) -> None:
+        """Report that reconnecting a device failed and when it is tried again."""
+        device = "rotation stage" if name == "stage" else "TDC"
+        self.statusBar().showMessage(
+            f"Reconnecting the {device} failed {attempts} time(s) ({msg}), "
+            f"trying again in {delay:.1f} s..."
+        )
+
+    def move_requests_received(self, requests: list) -> None:
+        """Move the stage as requested by the automatic control.
+
+        Requests that arrive after the automatic control was turned off or paused,
+        e.g., by a manual movement, are dropped.
+
+        :param requests: Batch of ``events.MoveRequest``.
+        """
+        for request in requests:
+            auto_control = self.auto_control
+            if not isinstance(auto_control, LaserAutoControl):
+                continue
+            if not auto_control.is_running:
+                continue
+            if request.kind == MOVE_UP:
+                self.auto_increase()
+            elif request.kind == MOVE_DOWN:
+                self.auto_decrease()
+            elif request.kind == MOVE_BURST:
+                self.auto_burst_decrease()
+            elif request.kind == MOVE_STEP:
+                self.auto_step(request.step)
 
     def move_stage_error(self, msg) -> None:
         """Accept the error of a movement, update the position, and unlock buttons."""
@@ -614,6 +1370,10 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
 
     def move_stage_finished(self) -> None:
         """Update GUI and unlock the buttons after a movement is done."""
+        position = self.power_curr_position
+        self.bus.publish(
+            MoveFinished(time.time(), float("nan") if position is None else position)
+        )
         self.power_curr_position_read()
         self.controls_active = True
         self.auto_checkbox.setEnabled(True)
@@ -626,20 +1386,207 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
         """Set / get current position"""
         return self._power_curr_position
 
+    def power_curr_offset_update(self, value: float):
+        """Update the current zero offset of the stage in degrees."""
+        self._power_curr_offset = value
+
+    def power_close(self):
+        """Close the connection to the rotation stage, if open."""
+        if self.power is not None:
+            try:
+                self.power.close()
+            except Exception:
+                pass  # broken connection, nothing left to close
+            self.power = None
+
     def power_curr_position_read(self):
-        """Read current position from Stage and set it to the value in degrees."""
-        value = self.power.ch.position.magnitude
+        """Request a read of the current position from the stage thread."""
+        if self.stage is not None:  # not while the stage is being reconnected
+            self.stage.read_position()
+
+    def power_curr_position_update(self, value: float):
+        """Set the current position to the value read in degrees."""
         self._power_curr_position = value
+        metrics.STAGE_POSITION.set(value)
         self._set_position_label()
+        self.bus.publish(PositionRead(time.time(), value))
+
+    def samples_received(self, samples: list) -> None:
+        """Record the count rates of the automatic control and show the last one.
+
+        :param samples: Batch of ``events.Sample``.
+        """
+        for sample in samples:
+            self.history_record(
+                EVENT_SAMPLE, sample.rate, sample.time, position=sample.position
+            )
+        auto_control = self.auto_control
+        if isinstance(auto_control, LaserAutoControl) and auto_control.is_running:
+            self._set_cps_label(samples[-1].rate)
+
+    def spectrum_show(self):
+        """Show the live spectrum of the active TDC channel in its own window."""
+        if self.mcs8a is None:
+            QtWidgets.QMessageBox.warning(
+                self, "Not initialized", "Please initialize the devices first."
+            )
+            return
+
+        self.mcs8a.active_channel = self.config.get("TDC Channel") - 1
+        if self.spectrum_dialog is None:
+            self.spectrum_dialog = QtWidgets.QDialog(self)
+            self.spectrum_dialog.setWindowTitle("Live Spectrum")
+            self.spectrum_dialog.setLayout(QtWidgets.QVBoxLayout())
+            self.spectrum_dialog.layout().addWidget(SpectrumView(self.mcs8a))
+        self.spectrum_dialog.findChild(SpectrumView).mcs8a = self.mcs8a
+        self.spectrum_dialog.show()
+        self.spectrum_dialog.raise_()
+
+    def stage_command_start(self, is_auto: bool = False) -> None:
+        """Prepare the GUI for a stage command that moves the stage.
+
+        :param is_auto: If we come from auto control, we don't want to turn it off.
+        """
+        # turn off auto control
+        if isinstance(self.auto_control, LaserAutoControl) and not is_auto:
+            self.auto_control.deactivate()
+            self._set_cps_label(None)
+
+        self.controls_active = False
+        self.auto_checkbox.setEnabled(False)
+
+    def stage_connection_lost(self, msg: str) -> None:
+        """Close the broken stage and reconnect it in the background.
+
+        The regulation stays paused until the stage is back, see ``stage_recovered``.
+
+        :param msg: Error message of the failure.
+        """
+        if self.supervisor.is_recovering("stage"):
+            return
+        self.controls_active = False
+        self.auto_checkbox.setEnabled(False)
+        self.statusBar().showMessage(
+            f"Connection to the rotation stage lost ({msg}), reconnecting..."
+        )
+
+        self._stage_restore = (
+            self.config.get("Port"),
+            self.config.get("Stage serial"),
+            dict(self.config.get("Stage ports")),
+            self._power_curr_position,
+            self.laser_settings.get("Zero offset (deg)"),
+            self.power.default_profile,
+            self.power.backlash_model,
+        )
+        self.stage_thread_stop()
+        self.power_close()
+        self.supervisor.device_failed("stage")
+
+    def stage_reconnect(self) -> tuple:
+        """Connect the stage again and restore its state, runs in the thread pool.
+
+        The zero offset of the laser profile is written without homing. If the
+        controller is still homed, i.e., it kept its state, the stage is moved back
+        to the position before the failure, corrected with the backlash model from
+        before the failure. Otherwise, e.g., if the controller lost
+        power, its position is not known and the stage is not moved, see
+        ``stage_recovered``.
+
+        :return: Stage, its port, the updated port cache, and if it is still homed.
+        """
+        port, serial_number, cache, position, offset, profile, backlash_model = (
+            self._stage_restore
+        )
+        if serial_number:
+            port = discovery.find_stage(serial_number, cache) or port
+
+        power = PowerControl(port)
+        try:
+            if abs(power.offset.magnitude - offset) > self.offset_tolerance:
+                power.offset = offset
+            homed = power.is_homed
+            if homed:
+                power.default_profile = profile  # controller has our last profile
+                power.set_backlash_model(backlash_model.backlash)
+                # the gear still rests against the side of the last move
+                power.backlash_model.direction = backlash_model.direction
+                if (
+                    position is not None
+                    and abs(power.position - position) > self.offset_tolerance
+                ):
+                    power.move(position, absolute=True)
+        except Exception:
+            power.close()
+            raise
+        return power, port, cache, homed
+
+    def stage_recovered(self, result: tuple) -> None:
+        """Use the reconnected stage and resume the regulation.
+
+        If the stage lost its home position, the automatic control is turned off
+        and the user is asked to home the stage, since homing sweeps through the
+        full laser power.
+        """
+        self.power, port, cache, homed = result
+        self.config.set("Port", port)
+        self.config.set("Stage ports", cache)
+        self.config.save()
+
+        self.init_stage_thread()
+        if not homed:
+            self.auto_checkbox.setChecked(False)  # turns the auto control off
+        self.move_stage_finished()  # unlocks the controls and resumes auto control
+        if not homed:
+            QtWidgets.QMessageBox.warning(
+                self,
+                "Rotation stage not homed",
+                "The rotation stage was reconnected but lost its home position, "
+                "e.g., because its controller was powered off. The automatic "
+                "control was turned off. Please home the stage before turning it "
+                "on again.",
+            )
+
+    def stage_port_find(self) -> str:
+        """Find the port of the configured rotation stage.
+
+        If the serial number of the stage is known, the cached port is checked
+        first, then all ports are probed, see ``discovery.find_stage``. The port in
+        the configuration is updated if the stage moved to another port.
+
+        :return: Port of the stage, the configured port if the stage was not found.
+        """
+        serial_number = self.config.get("Stage serial")
+        if serial_number:
+            cache = dict(self.config.get("Stage ports"))
+            port = discovery.find_stage(serial_number, cache)
+            self.config.set("Stage ports", cache)
+            if port is not None:
+                self.config.set("Port", port)
+            self.config.save()
+        return self.config.get("Port")
+
+    def stage_thread_stop(self) -> None:
+        """Stop the stage thread, if running, and wait until it has finished."""
+        if self.stage is not None:
+            self.stage.stop()
+            self.stage.wait()
+            self.stage = None
 
     def _set_position_label(self):
-        """Set position label in degrees."""
+        """Set position label in degrees, coalesced with other label updates."""
         prec = self.config.get("Display Precision")
-        self.position_label.setText(f"{self.power_curr_position:.{prec}f}\u00B0")
+        self.label_updater.set(
+            self.position_label.setText, f"{self.power_curr_position:.{prec}f}\u00b0"
+        )
+
+    def _set_cps_label(self, value: Union[int, float, None]):
+        """Set counts per second label, coalesced with other label updates.
 
-    def _set_cps_label(self, value: Union[int, float]):
-        """Set counts per second label."""
-        self.cps_label.setText(f"ROI: {int(value)} cps")
+        :param value: Count rate in counts per second, ``None`` clears the label.
+        """
+        text = "" if value is None else f"ROI: {int(value)} cps"
+        self.label_updater.set(self.cps_label.setText, text)
 
     def _set_theme(self):
         """Set the GUI theme."""
@@ -651,6 +1598,7 @@ class DesorptionLaserControlGUI(QtWidgets.QMainWindow):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # acquisition process in frozen app
     appctxt = ApplicationContext()  # 1. Instantiate ApplicationContext
     app = DesorptionLaserControlGUI()
     exit_code = appctxt.app.exec()  # 2. Invoke appctxt.app.exec_()
@@ -1,19 +1,131 @@
 """Class to communicate and get data from the MCS8a TDC."""
 
 import ctypes
+import sys
+import time
+from typing import Dict, List, Tuple, Union
 
-from datatypes import AcqStatus
+import numpy as np
+
+from datatypes import AcqSettings, AcqStatus, BOARDSETTING
+from metrics import DLL_LATENCY, LatencyTimer
+
+BIN_WIDTH = 80e-6  # width of one TDC bin in microseconds without bitshift
+
+# settings that can be changed: name -> (settings structure, command format)
+SETTING_COMMANDS = {
+    "range": ("acquisition", "range={}"),
+    "bitshift": ("acquisition", "bitshift={}"),
+    "roimin": ("acquisition", "roimin={}"),
+    "roimax": ("acquisition", "roimax={}"),
+    "sweepmode": ("board", "sweepmode={:x}"),
+    "prena": ("board", "prena={:x}"),
+    "swpreset": ("board", "swpreset={:g}"),
+    "timepreset": ("board", "rtpreset={:g}"),
+    "holdafter": ("board", "holdafter={:g}"),
+}
+
+
+# prototypes of the used DMCS8 API functions: name -> (argtypes, restype)
+DLL_PROTOTYPES = {
+    "GetStatusData": ((ctypes.POINTER(AcqStatus), ctypes.c_int), ctypes.c_int),
+    "GetSettingData": ((ctypes.POINTER(AcqSettings), ctypes.c_int), ctypes.c_int),
+    "GetMCSSetting": ((ctypes.POINTER(BOARDSETTING), ctypes.c_int), ctypes.c_int),
+    "LVGetDat": ((ctypes.POINTER(ctypes.c_uint32), ctypes.c_int), ctypes.c_int),
+    "RunCmd": ((ctypes.c_int, ctypes.c_char_p), None),
+}
+
+
+def load_dll(dllpath: str) -> ctypes.CDLL:
+    """Load a shared library that exports the DMCS8 API.
+
+    On Windows, this is the DMCS8.DLL of Fastcomtec (stdcall). On other platforms,
+    any shared library exporting the same functions can be loaded, e.g., the
+    stand-in that is built from ``src/stub/dmcs8_stub.c``.
+    The argument and return types of all used functions are declared, such that
+    ctypes does not have to guess them on every call.
+
+    :param dllpath: Path to the library.
+
+    :return: Loaded library.
+    """
+    if sys.platform == "win32":
+        dll = ctypes.WinDLL(dllpath)
+    else:
+        dll = ctypes.CDLL(dllpath)
+
+    for name, (argtypes, restype) in DLL_PROTOTYPES.items():
+        func = getattr(dll, name)
+        func.argtypes = argtypes
+        func.restype = restype
+    return dll
+
+
+def settings_commands(
+    structures: Dict[str, Union[AcqSettings, BOARDSETTING]], changes: dict
+) -> Tuple[List[str], Dict[str, Union[AcqSettings, BOARDSETTING]]]:
+    """Compare requested changes with the cached settings and create the commands.
+
+    Only settings that differ from the cached ones result in a command. The cached
+    settings structures are not changed: the new values are written to copies,
+    which should replace the cache only once the commands were sent successfully.
+
+    :param structures: Cached settings structures by name, see ``SETTING_COMMANDS``.
+    :param changes: Requested changes, setting name -> new value.
+
+    :return: Commands that must be sent to the TDC, updated copies of the settings
+        structures by name.
+
+    :raises ValueError: A setting is unknown.
+    """
+    unknown = [key for key in changes if key not in SETTING_COMMANDS]
+    if unknown:
+        raise ValueError(f"Unknown MCS8a setting: {', '.join(unknown)}")
+
+    updated = {
+        name: type(structure).from_buffer_copy(structure)
+        for name, structure in structures.items()
+    }
+    commands = []
+    for key, value in changes.items():
+        structure_name, cmd = SETTING_COMMANDS[key]
+        structure = updated[structure_name]
+        current = getattr(structure, key)
+        setattr(structure, key, value)
+        if getattr(structure, key) != current:
+            commands.append(cmd.format(value))
+    return commands, updated
 
 
 class MCS8aComm:
     def __init__(self, dllpath: str = "C:\Windows\System32\DMCS8.DLL"):
         """Initialize MCS8a Comms class."""
-        self.dll = ctypes.windll.LoadLibrary(dllpath)
+        self.dll = load_dll(dllpath)
 
         self._active_channel = 0
 
         # empty variables
         self._acquisition_status = None
+        self._status_time = 0.0
+        self._acquisition_settings = None
+        self._board_settings = None
+        self._spectrum = np.zeros(0, dtype=np.uint32)
+
+    @property
+    def acquisition_settings(self) -> AcqSettings:
+        """Get the cached acquisition settings of the active channel.
+
+        The settings are read from the TDC on first access and after calling
+        ``refresh_settings``.
+        """
+        if self._acquisition_settings is None:
+            settings = AcqSettings()
+            with LatencyTimer(DLL_LATENCY):
+                self.dll.GetSettingData(
+                    ctypes.byref(settings), ctypes.c_int(self.active_channel)
+                )
+            self._acquisition_settings = settings
+        return self._acquisition_settings
 
     @property
     def acquisition_status(self):
@@ -27,8 +139,29 @@ class MCS8aComm:
 
     @active_channel.setter
     def active_channel(self, value: int):
+        if value != self._active_channel:
+            self._acquisition_settings = None  # settings are per channel
         self._active_channel = value
 
+    @property
+    def bin_width(self) -> float:
+        """Get the width of one spectrum bin in microseconds."""
+        return BIN_WIDTH * 2**self.acquisition_settings.bitshift
+
+    @property
+    def board_settings(self) -> BOARDSETTING:
+        """Get the cached board settings.
+
+        The settings are read from the TDC on first access and after calling
+        ``refresh_settings``.
+        """
+        if self._board_settings is None:
+            settings = BOARDSETTING()
+            with LatencyTimer(DLL_LATENCY):
+                self.dll.GetMCSSetting(ctypes.byref(settings), ctypes.c_int(0))
+            self._board_settings = settings
+        return self._board_settings
+
     @property
     def is_measuring(self) -> bool:
         """Get status if the device is measuring.
@@ -44,24 +177,121 @@ class MCS8aComm:
 
         :return: Range set.
         """
-        raise NotImplementedError
+        return self.acquisition_settings.range
 
     @range.setter
     def range(self, value: int):
-        self.dll.RunCmd(0, bytes(f"range={value}", "ascii"))
+        self.apply_settings(range=value)
+
+    @property
+    def roi(self) -> Tuple[int, int]:
+        """Get / set the ROI of the MCS8a as tuple of minimum and maximum bin."""
+        return self.acquisition_settings.roimin, self.acquisition_settings.roimax
+
+    @roi.setter
+    def roi(self, value: Tuple[int, int]):
+        self.apply_settings(roimin=value[0], roimax=value[1])
 
     @property
     def roi_rate(self) -> float:
         """Get the rate countrate in counts per seconds in the ROI."""
         self._update_acquisition_status()
-        # todo: not sure why, but this seems to be the ROI Rate! check data structure
-        return self._acquisition_status.ofls
+        return self._acquisition_status.roirate
+
+    @property
+    def spectrum(self) -> np.ndarray:
+        """Get the current spectrum of the active channel.
+
+        The spectrum is read into a buffer that is re-used as long as the range does
+        not change. Copy the returned array if you want to keep it.
+
+        :return: Counts per bin.
+        """
+        num_bins = self.range
+        if self._spectrum.shape[0] != num_bins:
+            self._spectrum = np.zeros(num_bins, dtype=np.uint32)
+        with LatencyTimer(DLL_LATENCY):
+            self.dll.LVGetDat(
+                self._spectrum.ctypes.data_as(ctypes.POINTER(ctypes.c_uint32)),
+                ctypes.c_int(self.active_channel),
+            )
+        return self._spectrum
+
+    @property
+    def status_time(self) -> float:
+        """Get the ``time.monotonic()`` the acquisition status was read."""
+        return self._status_time
+
+    @property
+    def sweep_mode(self) -> int:
+        """Get / set the sweep mode of the board."""
+        return self.board_settings.sweepmode
+
+    @sweep_mode.setter
+    def sweep_mode(self, value: int):
+        self.apply_settings(sweepmode=value)
 
     # METHODS #
+
+    def apply_settings(self, **changes) -> int:
+        """Apply new settings to the TDC.
+
+        The requested changes are compared to the cached settings and only the
+        settings that differ are sent to the TDC, all in one go. Valid setting names
+        are the keys of ``SETTING_COMMANDS``.
+
+        :param changes: Settings to change, e.g., ``range=1024, roimin=10``.
+
+        :return: Number of commands that were sent.
+
+        :raises ValueError: A setting is unknown.
+        """
+        structures = {
+            "acquisition": self.acquisition_settings,
+            "board": self.board_settings,
+        }
+        commands, updated = settings_commands(structures, changes)
+        try:
+            for cmd in commands:
+                with LatencyTimer(DLL_LATENCY):
+                    self.dll.RunCmd(0, bytes(cmd, "ascii"))
+        except Exception:
+            self.refresh_settings()  # cache might not represent the TDC anymore
+            raise
+        self._acquisition_settings = updated["acquisition"]
+        self._board_settings = updated["board"]
+        return len(commands)
+
+    def refresh_settings(self) -> None:
+        """Discard the cached settings, they will be read again on next access."""
+        self._acquisition_settings = None
+        self._board_settings = None
+
+    def spectrum_window(self, bin_min: int, bin_max: int) -> np.ndarray:
+        """Get a range of bins of the spectrum of the active channel.
+
+        :param bin_min: First bin.
+        :param bin_max: Bin after the last one, bins beyond the spectrum are omitted.
+
+        :return: Counts per bin.
+        """
+        return self.spectrum[bin_min:bin_max]
+
     def _update_acquisition_status(self):
-        """Grab the acquisition status and update the class reference."""
+        """Grab the acquisition status and update the class reference.
+
+        When a new acquisition was started, the settings might have been changed in
+        the MCS8a software, thus the cached settings are discarded.
+        """
         status = AcqStatus()
-        self.dll.GetStatusData(ctypes.byref(status), ctypes.c_int(self.active_channel))
+        with LatencyTimer(DLL_LATENCY):
+            self.dll.GetStatusData(
+                ctypes.byref(status), ctypes.c_int(self.active_channel)
+            )
+        self._status_time = time.monotonic()
+        previous = self._acquisition_status
+        if status.started == 1 and (previous is None or previous.started != 1):
+            self.refresh_settings()
         self._acquisition_status = status
 
 
@@ -73,6 +303,25 @@ class FakeMCS8aComm:
         self._active_channel = 0
         # empty variables
         self._acquisition_status = None
+        self._status_time = 0.0
+        self._acquisition_settings = AcqSettings(range=2**16, bitshift=6)
+        self._board_settings = BOARDSETTING()
+
+        # fake spectrum with two peaks, rates in counts per second and bin
+        self._start_time = time.time()
+        self._rng = np.random.default_rng()
+        tof = np.arange(self.range) * self.bin_width
+        self._spectrum_rates = 0.01 + 2.0 * (
+            np.exp(-0.5 * ((tof - 10.0) / 0.05) ** 2)
+            + 0.5 * np.exp(-0.5 * ((tof - 20.0) / 0.05) ** 2)
+        )
+        self._spectrum = np.zeros(self.range, dtype=np.uint32)
+        self._spectrum_runtime = 0.0
+
+    @property
+    def acquisition_settings(self) -> AcqSettings:
+        """Get the fake acquisition settings."""
+        return self._acquisition_settings
 
     @property
     def acquisition_status(self):
@@ -88,12 +337,23 @@ class FakeMCS8aComm:
     def active_channel(self, value: int):
         self._active_channel = value
 
+    @property
+    def bin_width(self) -> float:
+        """Get the width of one spectrum bin in microseconds."""
+        return BIN_WIDTH * 2**self.acquisition_settings.bitshift
+
+    @property
+    def board_settings(self) -> BOARDSETTING:
+        """Get the fake board settings."""
+        return self._board_settings
+
     @property
     def is_measuring(self) -> bool:
         """Get status if the device is measuring.
 
         :return: We are measuring!
         """
+        self._update_acquisition_status()
         return True
 
     @property
@@ -102,17 +362,145 @@ class FakeMCS8aComm:
 
         :return: Range set.
         """
-        raise NotImplementedError
+        return self.acquisition_settings.range
 
     @range.setter
     def range(self, value: int):
-        print(f"Set range with value: {value}")
+        self.apply_settings(range=value)
+
+    @property
+    def roi(self) -> Tuple[int, int]:
+        """Get / set the ROI of the MCS8a as tuple of minimum and maximum bin."""
+        return self.acquisition_settings.roimin, self.acquisition_settings.roimax
+
+    @roi.setter
+    def roi(self, value: Tuple[int, int]):
+        self.apply_settings(roimin=value[0], roimax=value[1])
 
     @property
     def roi_rate(self) -> float:
         """Get the rate countrate in counts per seconds in the ROI."""
         return 500.2
 
+    @property
+    def spectrum(self) -> np.ndarray:
+        """Get a fake spectrum that builds up with the runtime.
+
+        The spectrum is built up to the runtime of the last status update, the
+        status is updated first if it was never read.
+
+        :return: Counts per bin.
+        """
+        if self._acquisition_status is None:
+            self._update_acquisition_status()
+        runtime = self._acquisition_status.runtime
+        delta_t = runtime - self._spectrum_runtime
+        self._spectrum += self._rng.poisson(self._spectrum_rates * delta_t).astype(
+            np.uint32
+        )
+        self._spectrum_runtime = runtime
+        return self._spectrum
+
+    @property
+    def status_time(self) -> float:
+        """Get the ``time.monotonic()`` the acquisition status was read."""
+        return self._status_time
+
+    @property
+    def sweep_mode(self) -> int:
+        """Get / set the sweep mode of the board."""
+        return self.board_settings.sweepmode
+
+    @sweep_mode.setter
+    def sweep_mode(self, value: int):
+        self.apply_settings(sweepmode=value)
+
+    # METHODS #
+
+    def apply_settings(self, **changes) -> int:
+        """Apply new settings to the fake TDC.
+
+        :param changes: Settings to change, e.g., ``range=1024, roimin=10``.
+
+        :return: Number of commands that would have been sent.
+        """
+        structures = {
+            "acquisition": self.acquisition_settings,
+            "board": self.board_settings,
+        }
+        commands, updated = settings_commands(structures, changes)
+        for cmd in commands:
+            print(f"Send command: {cmd}")
+        self._acquisition_settings = updated["acquisition"]
+        self._board_settings = updated["board"]
+        return len(commands)
+
+    def refresh_settings(self) -> None:
+        """Nothing to refresh for the fake TDC."""
+        pass
+
+    def spectrum_window(self, bin_min: int, bin_max: int) -> np.ndarray:
+        """Get a range of bins of the spectrum of the active channel.
+
+        :param bin_min: First bin.
+        :param bin_max: Bin after the last one, bins beyond the spectrum are omitted.
+
+        :return: Counts per bin.
+        """
+        return self.spectrum[bin_min:bin_max]
+
+    def _update_acquisition_status(self):
+        """Create a fake acquisition status."""
+        status = AcqStatus()
+        status.started = 1
+        status.runtime = time.time() - self._start_time
+        status.roirate = self.roi_rate
+        status.roisum = status.roirate * status.runtime
+        status.sweeps = int(status.runtime * 1000)  # 1 kHz laser
+        self._acquisition_status = status
+        self._status_time = time.monotonic()
+
+
+def benchmark(dllpath: str, num_calls: int = 10000) -> None:
+    """Benchmark the per call overhead of the ctypes interface to the DLL.
+
+    Prints the time per call for reading the status with and without declared
+    prototypes as well as for reading the spectrum.
+
+    :param dllpath: Path to the library that exports the DMCS8 API.
+    :param num_calls: Number of calls to average over.
+    """
+    tdc = MCS8aComm(dllpath=dllpath)
+
+    def per_call(func) -> float:
+        """Time per call of ``func`` in microseconds."""
+        tic = time.perf_counter()
+        for _ in range(num_calls):
+            func()
+        return (time.perf_counter() - tic) / num_calls * 1e6
+
+    status = AcqStatus()
+    channel = ctypes.c_int(0)
+    raw_dll = (
+        ctypes.WinDLL(dllpath) if sys.platform == "win32" else ctypes.CDLL(dllpath)
+    )
+
+    results = {
+        "GetStatusData, with prototypes": per_call(
+            lambda: tdc.dll.GetStatusData(ctypes.byref(status), channel)
+        ),
+        "GetStatusData, without prototypes": per_call(
+            lambda: raw_dll.GetStatusData(ctypes.byref(status), channel)
+        ),
+        "MCS8aComm.roi_rate": per_call(lambda: tdc.roi_rate),
+        f"MCS8aComm.spectrum ({tdc.range} bins)": per_call(lambda: tdc.spectrum),
+    }
+    for name, value in results.items():
+        print(f"{name}: {value:.2f} us per call")
+
 
 if __name__ == "__main__":
-    tdc = MCS8aComm()
+    if len(sys.argv) > 1:
+        benchmark(sys.argv[1])
+    else:
+        tdc = MCS8aComm()
@@ -0,0 +1,331 @@
+"""Metrics of the control loop in the OpenMetrics text format.
+
+The metrics are updated incrementally by the control loop and only read when they
+are scraped, either from a localhost HTTP endpoint or from a text file that is
+written periodically (e.g., for the textfile collector of a node exporter).
+Updates are single assignments or appends that do not take any locks, such that
+scraping can never stall the control loop. A scrape might thus see one metric
+updated and another one not yet, which is fine for monitoring.
+"""
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import os
+from pathlib import Path
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+
+def format_value(value: float) -> str:
+    """Format a sample value for the OpenMetrics text format."""
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class Metric:
+    """Base class of all metrics.
+
+    :param name: Name of the metric, without unit suffix like ``_total``.
+    :param documentation: Help text of the metric.
+    """
+
+    metric_type = "unknown"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+
+    def render(self) -> List[str]:
+        """Render the metric in the OpenMetrics text format.
+
+        :return: Lines of the metric family.
+        """
+        return [
+            f"# TYPE {self.name} {self.metric_type}",
+            f"# HELP {self.name} {self.documentation}",
+        ] + self.samples()
+
+    def samples(self) -> List[str]:
+        """Get the sample lines of the metric."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increase the counter.
+
+        :param amount: Amount to increase by, must not be negative.
+        """
+        self.value += amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}_total {format_value(self.value)}"]
+
+
+class Gauge(Metric):
+    """Value that can go up and down. The value is NaN until it is set."""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self.value = float("nan")
+
+    def set(self, value: float) -> None:
+        """Set the gauge to a new value."""
+        self.value = float(value)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {format_value(self.value)}"]
+
+
+class RatioGauge(Gauge):
+    """Gauge that is the ratio of two counters, calculated when scraped."""
+
+    def __init__(
+        self, name: str, documentation: str, numerator: Counter, denominator: Counter
+    ):
+        super().__init__(name, documentation)
+        self.numerator = numerator
+        self.denominator = denominator
+
+    def samples(self) -> List[str]:
+        denominator = self.denominator.value
+        value = self.numerator.value / denominator if denominator > 0 else 0.0
+        return [f"{self.name} {format_value(value)}"]
+
+
+class EventRateGauge(Gauge):
+    """Number of events per minute, calculated over the last minute when scraped."""
+
+    def __init__(self, name: str, documentation: str, maxlen: int = 10000):
+        super().__init__(name, documentation)
+        self._times = deque(maxlen=maxlen)
+
+    def event(self) -> None:
+        """Record that an event happened now."""
+        self._times.append(time.monotonic())
+
+    def samples(self) -> List[str]:
+        times = np.array(self._times)
+        value = int(np.count_nonzero(times >= time.monotonic() - 60))
+        return [f"{self.name} {value}"]
+
+
+class Summary(Metric):
+    """Summary of observations, e.g., latencies.
+
+    Count and sum are kept over all observations. The quantiles are calculated when
+    scraped from a fixed size window of the most recent observations.
+
+    :param window: Number of recent observations to calculate the quantiles from.
+    """
+
+    metric_type = "summary"
+    quantiles = (0.5, 0.9, 0.99)
+
+    def __init__(self, name: str, documentation: str, window: int = 1000):
+        super().__init__(name, documentation)
+        self.count = 0
+        self.sum = 0.0
+        self._window = np.zeros(window)
+
+    def observe(self, value: float) -> None:
+        """Add an observation."""
+        self._window[self.count % self._window.shape[0]] = value
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> List[str]:
+        count = self.count
+        lines = []
+        if count > 0:
+            values = np.quantile(
+                self._window[: min(count, self._window.shape[0])], self.quantiles
+            )
+            lines = [
+                f'{self.name}{{quantile="{quantile}"}} {format_value(value)}'
+                for quantile, value in zip(self.quantiles, values)
+            ]
+        return lines + [
+            f"{self.name}_count {count}",
+            f"{self.name}_sum {format_value(self.sum)}",
+        ]
+
+
+class LatencyTimer:
+    """Context manager that observes the time spent inside it in a summary.
+
+    :param summary: Summary to observe the latency in seconds with.
+    """
+
+    def __init__(self, summary: Summary):
+        self.summary = summary
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.summary.observe(time.perf_counter() - self._start)
+        return False
+
+
+class MetricsRegistry:
+    """Collection of metrics that are exported together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        """Register a metric and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the OpenMetrics text format."""
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+ROI_RATE = REGISTRY.register(
+    Gauge("dlc_roi_rate_cps", "Count rate in the regulated ROI.")
+)
+WINDOW_MIN = REGISTRY.register(
+    Gauge("dlc_window_min_cps", "Lower limit of the target count rate window.")
+)
+WINDOW_MAX = REGISTRY.register(
+    Gauge("dlc_window_max_cps", "Upper limit of the target count rate window.")
+)
+WINDOW_BURST = REGISTRY.register(
+    Gauge("dlc_window_burst_cps", "Count rate above which a burst is detected.")
+)
+STAGE_POSITION = REGISTRY.register(
+    Gauge("dlc_stage_position_degrees", "Position of the rotation stage.")
+)
+MOVES = REGISTRY.register(Counter("dlc_moves", "Number of stage movements."))
+MOVES_PER_MINUTE = REGISTRY.register(
+    EventRateGauge("dlc_moves_per_minute", "Stage movements during the last minute.")
+)
+BURSTS = REGISTRY.register(Counter("dlc_bursts", "Number of burst decreases."))
+REGULATED_SECONDS = REGISTRY.register(
+    Counter("dlc_regulated_seconds", "Time the automatic control was running.")
+)
+IN_WINDOW_SECONDS = REGISTRY.register(
+    Counter("dlc_in_window_seconds", "Time the count rate was inside the window.")
+)
+TIME_IN_WINDOW = REGISTRY.register(
+    RatioGauge(
+        "dlc_time_in_window_ratio",
+        "Fraction of the regulated time the count rate was inside the window.",
+        IN_WINDOW_SECONDS,
+        REGULATED_SECONDS,
+    )
+)
+DLL_LATENCY = REGISTRY.register(
+    Summary("dlc_dll_call_seconds", "Latency of calls to the MCS8a DLL.")
+)
+SERIAL_LATENCY = REGISTRY.register(
+    Summary(
+        "dlc_serial_call_seconds",
+        "Latency of calls to the rotation stage, without movements.",
+    )
+)
+MOVE_DURATION = REGISTRY.register(
+    Summary("dlc_move_seconds", "Duration of the movements of the rotation stage.")
+)
+DEVICE_FAILURES = REGISTRY.register(
+    Counter("dlc_device_failures", "Number of failures of the TDC or the stage.")
+)
+RECOVERY_SECONDS = REGISTRY.register(
+    Summary(
+        "dlc_recovery_seconds", "Time from a device failure until it was reconnected."
+    )
+)
+BURST_REACTION = REGISTRY.register(
+    Summary(
+        "dlc_burst_reaction_seconds",
+        "Time from a burst decrease request until the stage reached the new angle.",
+    )
+)
+
+
+class MetricsServer:
+    """HTTP server on localhost that exports the metrics on ``/metrics``.
+
+    The server runs in its own daemon thread.
+
+    :param port: Port to listen on.
+    :param registry: Registry to export.
+    """
+
+    def __init__(self, port: int, registry: MetricsRegistry = REGISTRY):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    "application/openmetrics-text; version=1.0.0; charset=utf-8",
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # do not spam the console with every scrape
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        """Get the port the server listens on."""
+        return self.server.server_address[1]
+
+    def stop(self) -> None:
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def write_textfile(fname: Path, registry: MetricsRegistry = REGISTRY) -> None:
+    """Write the metrics to a text file.
+
+    The file is written to a temporary file first and then moved into place, such
+    that a collector never reads a partially written file.
+
+    :param fname: File to write to.
+    :param registry: Registry to export.
+    """
+    fname = Path(fname)
+    tmp_file = fname.with_name(f".{fname.name}.tmp")
+    tmp_file.write_text(registry.render(), encoding="utf-8")
+    os.replace(tmp_file, fname)
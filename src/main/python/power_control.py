@@ -1,14 +1,76 @@
 """Control the Thorlabs rotation stage for laser power."""
 
+import math
+import struct
+import time
+from typing import NamedTuple
 
 import instruments as ik
 from instruments import units as u
+from instruments.thorlabs._cmds import ThorLabsCommands
+from instruments.thorlabs._packets import ThorLabsPacket
+
+from metrics import MOVE_DURATION, SERIAL_LATENCY, LatencyTimer
+
+
+class MotionProfile(NamedTuple):
+    """Velocity profile of a move."""
+
+    velocity: float  # maximum velocity in deg/s
+    acceleration: float  # acceleration in deg/s^2
+
+
+# motion profiles of the PRM1-Z8, which can do at most 25 deg/s and 25 deg/s^2
+MOTION_FINE = MotionProfile(5.0, 5.0)  # small regulation steps, lands smoothly
+MOTION_BURST = MotionProfile(25.0, 25.0)  # cut the power as fast as possible
+STATUS_HOMED = 0x00000400  # status bit of the APT controllers, set once homed
+
+# manual moves use the profile the controller had at connect, see
+# ``PowerControl.default_profile``, this one only if it cannot be read
+MOTION_DEFAULT = MotionProfile(10.0, 10.0)
+
+
+class BacklashModel:
+    """Backlash of the rotation stage.
+
+    The hardware backlash correction of the controller always overshoots and
+    returns, which makes every move slow. Instead, the backlash is added to the
+    first move after the direction of motion reversed, such that the half-wave
+    plate actually moves by the requested step. Only the calibrated backlash is
+    applied, the motor encoder cannot see the play between motor and plate.
+
+    :param backlash: Lost motion on a reversal of the direction in degrees.
+    """
+
+    def __init__(self, backlash: float = 0.0):
+        self.backlash = backlash
+        self.direction = 0  # direction of the last move, 0 if unknown
+
+    def command(self, step: float) -> float:
+        """Get the step to command to the motor for a requested step.
+
+        :param step: Requested step of the half-wave plate in degrees.
+
+        :return: Step to command to the motor in degrees.
+        """
+        if step == 0:
+            return 0.0
+        direction = int(math.copysign(1, step))
+        motor_step = step
+        if self.direction not in (0, direction):
+            motor_step += direction * self.backlash
+        self.direction = direction
+        return motor_step
+
+    def reset(self) -> None:
+        """Forget the direction of the last move, e.g., after homing."""
+        self.direction = 0
 
 
 class PowerControl:
     """Commands used for this program to control half-wave plate."""
 
-    def __init__(self, port: str, baud: int = 115200, gui=None) -> None:
+    def __init__(self, port: str, baud: int = 115200) -> None:
         """Initializes communication with the rotation stage.
 
         :param port: Port the rotation stage can be found at.
@@ -24,13 +86,45 @@ class PowerControl:
         self.kdc = ik.thorlabs.APTMotorController.open_serial(port, baud=baud)
         self.ch = self.kdc.channel[0]
 
-        self.gui = gui
+        self.backlash_model = BacklashModel()
+        self._position = None  # last position read from the encoder (deg)
+        self._motion_profile = None  # profile last sent to the controller
 
         self.ch.motor_model = self._motor_model
 
         # turn off backlash correction
         self.ch.backlash_correction = 0
 
+        # profile of the controller at connect, e.g., set in the Kinesis software
+        self.default_profile = self.read_motion_profile()
+        self._motion_profile = self.default_profile
+
+    @property
+    def is_homed(self) -> bool:
+        """Get if the stage was homed since the controller was powered on.
+
+        InstrumentKit has no getter for the status bits, thus the APT packet is sent
+        directly.
+        """
+        packet = ThorLabsPacket(
+            message_id=ThorLabsCommands.MOT_REQ_STATUSUPDATE,
+            param1=self.ch._idx_chan,
+            param2=0x00,
+            dest=self.ch._apt.destination,
+            source=0x01,
+            data=None,
+        )
+        with LatencyTimer(SERIAL_LATENCY):
+            response = self.ch._apt.querypacket(
+                packet,
+                expect=ThorLabsCommands.MOT_GET_STATUSUPDATE,
+                expect_data_len=14,
+            )
+        if response is None:
+            raise OSError("The stage did not answer the status request.")
+        status_bits = struct.unpack("<HllL", response.data)[3]
+        return bool(status_bits & STATUS_HOMED)
+
     @property
     def motor_model(self) -> str:
         """Get / set motor model."""
@@ -40,6 +134,14 @@ class PowerControl:
     def motor_model(self, value: str):
         self._motor_model = value
 
+    @property
+    def position(self) -> float:
+        """Get the current position in degrees."""
+        with LatencyTimer(SERIAL_LATENCY):
+            position = self.ch.position.magnitude
+        self._position = position
+        return position
+
     @property
     def offset(self) -> float:
         """Get / set offset in degrees.
@@ -48,19 +150,219 @@ class PowerControl:
 
         :return: Offset currently set in degrees.
         """
-        return self.ch.home_parameters[3]
+        with LatencyTimer(SERIAL_LATENCY):
+            return self.ch.home_parameters[3]
 
     @offset.setter
     def offset(self, value: float):
         if not isinstance(value, u.Quantity):
             value *= u.deg  # assume degrees
-        self.ch.home_parameters = None, None, None, value
+        with LatencyTimer(SERIAL_LATENCY):
+            self.ch.home_parameters = None, None, None, value
 
     # METHODS #
 
-    def home(self) -> None:
-        """Home the device."""
-        self.ch.go_home()
+    def close(self) -> None:
+        """Close the serial port, such that it can be opened again."""
+        self.kdc._file.close()
+
+    def home(self, timeout: float = 100) -> None:
+        """Home the device.
+
+        :param timeout: Timeout for homing in seconds.
+        """
+        default_timeout = self.ch.motion_timeout
+        self.ch.motion_timeout = timeout * u.sec
+        try:
+            self.ch.go_home()
+        finally:
+            self.ch.motion_timeout = default_timeout
+            self.backlash_model.reset()
+            self._position = None
+
+    def move(
+        self,
+        val: float,
+        absolute: bool = True,
+        profile: MotionProfile = None,
+    ) -> None:
+        """Move the stage, corrected for backlash.
+
+        All moves are sent as relative moves of the motor, see ``BacklashModel``.
+
+        :param val: Position (absolute) or step (relative) in degrees.
+        :param absolute: Absolute move or not?
+        :param profile: Motion profile of the move, ``default_profile`` if not given.
+        """
+        start = self._position if self._position is not None else self.position
+        step = val - start if absolute else val
+        motor_step = self.backlash_model.command(step)
+        if motor_step == 0:
+            return
+
+        self.set_motion_profile(profile or self.default_profile)
+        self._position = None  # unknown until read again
+        with LatencyTimer(MOVE_DURATION):  # blocks until the move has finished
+            self.ch.move(motor_step * u.degree, absolute=False)
+
+    def read_motion_profile(self) -> MotionProfile:
+        """Read the velocity parameters of the controller.
+
+        InstrumentKit has no getter for them, thus the APT packet is sent directly.
+
+        :return: Motion profile of the controller, ``MOTION_DEFAULT`` if the
+            controller did not answer.
+        """
+        packet = ThorLabsPacket(
+            message_id=ThorLabsCommands.MOT_REQ_VELPARAMS,
+            param1=self.ch._idx_chan,
+            param2=0x00,
+            dest=self.ch._apt.destination,
+            source=0x01,
+            data=None,
+        )
+        try:
+            with LatencyTimer(SERIAL_LATENCY):
+                response = self.ch._apt.querypacket(
+                    packet,
+                    expect=ThorLabsCommands.MOT_GET_VELPARAMS,
+                    expect_data_len=14,
+                )
+        except OSError:  # InstrumentKit raises if the reply is missing or wrong
+            response = None
+        if response is None:
+            return MOTION_DEFAULT
+
+        _, velocity_scale, acceleration_scale = self.ch.scale_factors
+        _, _, acceleration, velocity = struct.unpack("<HLLL", response.data)
+        return MotionProfile(
+            velocity / velocity_scale.magnitude,
+            acceleration / acceleration_scale.magnitude,
+        )
+
+    def set_motion_profile(self, profile: MotionProfile) -> None:
+        """Set the velocity parameters of the controller.
+
+        The parameters are only sent if they differ from the ones sent last.
+        InstrumentKit has no setter for them, thus the APT packet is sent directly.
+
+        :param profile: Motion profile to set.
+        """
+        if profile == self._motion_profile:
+            return
+
+        _, velocity_scale, acceleration_scale = self.ch.scale_factors
+        data = struct.pack(
+            "<HLLL",
+            self.ch._idx_chan,
+            0,  # minimum velocity, always zero
+            int(round(profile.acceleration * acceleration_scale.magnitude)),
+            int(round(profile.velocity * velocity_scale.magnitude)),
+        )
+        packet = ThorLabsPacket(
+            message_id=ThorLabsCommands.MOT_SET_VELPARAMS,
+            param1=None,
+            param2=None,
+            dest=self.ch._apt.destination,
+            source=0x01,
+            data=data,
+        )
+        with LatencyTimer(SERIAL_LATENCY):
+            self.ch._apt.sendpacket(packet)
+        self._motion_profile = profile
+
+    def set_backlash_model(self, backlash: float) -> None:
+        """Set the backlash model, e.g., from the laser profile.
+
+        :param backlash: Lost motion on a reversal of the direction in degrees.
+        """
+        self.backlash_model = BacklashModel(backlash)
+
+
+class FakePowerControl:
+    """A fake rotation stage that takes as long to move as the real one would.
+
+    The duration of a move is calculated from the trapezoidal velocity profile of
+    its motion profile.
+    """
+
+    def __init__(self, position: float = 10.0, home_duration: float = 2.0):
+        """Initialize the fake stage.
+
+        :param position: Initial position in degrees.
+        :param home_duration: Time homing takes in seconds.
+        """
+        self.motor_model = "PRM1-Z8"
+        self.home_duration = home_duration
+        self.backlash_model = BacklashModel()
+        self.default_profile = MOTION_DEFAULT
+        self._position = position
+        self._offset = 0.0
+        self._motion_profile = MOTION_DEFAULT
+
+    @property
+    def is_homed(self) -> bool:
+        """Get if the fake stage was homed, it always is."""
+        return True
+
+    @property
+    def position(self) -> float:
+        """Get the current position in degrees."""
+        return self._position
+
+    @property
+    def offset(self) -> u.Quantity:
+        """Get / set offset in degrees."""
+        return u.Quantity(self._offset, u.degree)
+
+    @offset.setter
+    def offset(self, value: float):
+        if isinstance(value, u.Quantity):
+            value = value.to(u.degree).magnitude
+        self._offset = value
+
+    def close(self) -> None:
+        """Close the fake stage, nothing to do."""
+
+    def home(self, timeout: float = 100) -> None:
+        """Home the fake stage.
+
+        :param timeout: Timeout for homing in seconds, ignored.
+        """
+        time.sleep(self.home_duration)
+        self._position = 0.0
+        self.backlash_model.reset()
+
+    def move(
+        self,
+        val: float,
+        absolute: bool = True,
+        profile: MotionProfile = None,
+    ) -> None:
+        """Move the fake stage and wait as long as the move would take.
+
+        :param val: Position (absolute) or step (relative) in degrees.
+        :param absolute: Absolute move or not?
+        :param profile: Motion profile of the move, ``default_profile`` if not given.
+        """
+        profile = profile or self.default_profile
+        self.set_motion_profile(profile)
+        distance = abs(val - self._position if absolute else val)
+        velocity, acceleration = profile
+        if distance > velocity**2 / acceleration:  # reaches maximum velocity
+            duration = distance / velocity + velocity / acceleration
+        else:
+            duration = 2 * math.sqrt(distance / acceleration)
+        time.sleep(duration)
+        self._position = val if absolute else self._position + val
+
+    def set_motion_profile(self, profile: MotionProfile) -> None:
+        """Set the motion profile of the following moves."""
+        self._motion_profile = profile
+
+    def set_backlash_model(self, backlash: float) -> None:
+        """Set the backlash model, which the fake stage does not need."""
+        self.backlash_model = BacklashModel(backlash)
 
 
 if __name__ == "__main__":
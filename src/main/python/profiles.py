@@ -0,0 +1,83 @@
+"""Registry of the laser profiles that are stored in the laser configuration folder."""
+
+import json
+from pathlib import Path
+from typing import Dict, List
+
+
+class LaserProfileRegistry:
+    """Index and cache all laser profiles (``*.json``) in a folder.
+
+    Profiles are identified by the stem of their file name. A profile is only read
+    from disk again if its file has been modified since it was cached.
+    """
+
+    def __init__(self, folder: Path):
+        """Initialize the registry.
+
+        :param folder: Folder that contains the laser profiles.
+        """
+        self.folder = Path(folder)
+        self._profiles = {}  # name -> (modification time, settings)
+
+    @property
+    def names(self) -> List[str]:
+        """Get the sorted names of all cached profiles."""
+        return sorted(self._profiles.keys(), key=str.lower)
+
+    def get(self, name: str) -> Dict:
+        """Get a copy of the settings of a profile.
+
+        :param name: Name of the profile.
+
+        :return: Settings of the profile.
+
+        :raises KeyError: Profile does not exist.
+        """
+        return dict(self._profiles[name][1])
+
+    def path(self, name: str) -> Path:
+        """Get the file of a profile.
+
+        :param name: Name of the profile.
+
+        :return: Path to the profile.
+        """
+        return self.folder.joinpath(name).with_suffix(".json")
+
+    def refresh(self) -> List[str]:
+        """Scan the folder and update the cache with new and modified profiles.
+
+        Files that cannot be read as JSON dictionary are skipped.
+
+        :return: Sorted names of all profiles.
+        """
+        profiles = {}
+        for fname in self.folder.glob("*.json"):
+            try:
+                mtime = fname.stat().st_mtime
+                cached = self._profiles.get(fname.stem)
+                if cached is not None and cached[0] == mtime:
+                    profiles[fname.stem] = cached
+                    continue
+
+                settings = json.loads(fname.read_text())
+            except (OSError, ValueError):
+                continue
+            if isinstance(settings, dict):
+                profiles[fname.stem] = (mtime, settings)
+
+        self._profiles = profiles
+        return self.names
+
+    def update(self, name: str, settings: Dict) -> None:
+        """Update the cache with the settings of a profile that were just saved.
+
+        :param name: Name of the profile.
+        :param settings: Settings of the profile.
+        """
+        try:
+            mtime = self.path(name).stat().st_mtime
+        except OSError:
+            mtime = None  # not on disk (yet), will be re-read on next refresh
+        self._profiles[name] = (mtime, dict(settings))
@@ -0,0 +1,357 @@
+"""Keep the history of long sessions in constant memory.
+
+Recent records are kept at full resolution in a ring buffer. All samples are also
+aggregated into tiers of fixed time resolution, by default per second, per minute,
+and per hour, each a ring buffer of fixed size as well. Queries use the finest
+tier that still covers the requested time span, such that runs over several days
+take constant memory and are analyzed, exported, or plotted in constant time.
+"""
+
+from pathlib import Path
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from history import EVENT_BURST, EVENT_MOVE, EVENT_SAMPLE, HISTORY_DTYPE
+
+AGGREGATE_DTYPE = np.dtype(
+    [
+        ("time", np.float64),  # unix time of the start of the bucket in seconds
+        ("count", np.uint32),  # number of count rate samples
+        ("rate_min", np.float64),  # count rates in cps, NaN without samples
+        ("rate_max", np.float64),
+        ("rate_mean", np.float64),
+        ("position_min", np.float64),  # stage positions of the samples in degrees
+        ("position_max", np.float64),
+        ("position_mean", np.float64),
+        ("moves", np.uint32),  # number of movements, bursts included
+        ("bursts", np.uint32),
+        ("window_min", np.float32),  # target window of the last record in cps
+        ("window_max", np.float32),
+    ]
+)
+
+# resolution in seconds, number of buckets: one day, 30 days, one year
+DEFAULT_TIERS = ((1.0, 86400), (60.0, 43200), (3600.0, 8760))
+
+
+class RingBuffer:
+    """Fixed-size buffer of records in time order, the oldest are overwritten.
+
+    :param capacity: Number of records that can be stored.
+    :param dtype: Numpy dtype of the records, must have a ``time`` field.
+    """
+
+    def __init__(self, capacity: int, dtype: np.dtype):
+        self._data = np.zeros(capacity, dtype=dtype)
+        self._size = 0
+        self._next = 0  # index that is written next
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        """Get the number of records that can be stored."""
+        return self._data.shape[0]
+
+    @property
+    def is_full(self) -> bool:
+        """Get if old records are being overwritten."""
+        return self._size == self.capacity
+
+    @property
+    def oldest_time(self) -> float:
+        """Get the time of the oldest record, NaN if empty."""
+        if self._size == 0:
+            return np.nan
+        return self._data["time"][self._next if self.is_full else 0]
+
+    def append(self, record: tuple) -> None:
+        """Append a record, overwriting the oldest one if full."""
+        self._data[self._next] = record
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def clear(self) -> None:
+        """Remove all records."""
+        self._size = 0
+        self._next = 0
+
+    def since(self, start: float) -> np.ndarray:
+        """Get a copy of the records from a start time on, in time order.
+
+        :param start: Time of the first record to return.
+
+        :return: Records from the start time on.
+        """
+        if not self.is_full:
+            data = self._data[: self._size]
+            return data[np.searchsorted(data["time"], start) :].copy()
+
+        older, newer = self._data[self._next :], self._data[: self._next]
+        if newer.shape[0] and start >= newer["time"][0]:
+            return newer[np.searchsorted(newer["time"], start) :].copy()
+        return np.concatenate((older[np.searchsorted(older["time"], start) :], newer))
+
+
+class AggregateTier:
+    """Aggregate the samples into buckets of fixed duration.
+
+    :param resolution: Duration of a bucket in seconds.
+    :param capacity: Number of buckets that are kept.
+    """
+
+    def __init__(self, resolution: float, capacity: int):
+        self.resolution = resolution
+        self.buckets = RingBuffer(capacity, AGGREGATE_DTYPE)
+        self._bucket = None  # start time of the bucket being filled
+        self._reset()
+
+    def add(
+        self,
+        timestamp: float,
+        event: int,
+        rate: float,
+        position: float,
+        window_min: float,
+        window_max: float,
+    ) -> None:
+        """Add a record to its bucket, the previous bucket is completed if needed.
+
+        See ``history.SessionHistory.append`` for the parameters.
+        """
+        bucket = timestamp - timestamp % self.resolution
+        if bucket != self._bucket:
+            if self._bucket is not None:
+                self.buckets.append(self.current())
+            self._bucket = bucket
+            self._reset()
+
+        if event == EVENT_SAMPLE:
+            self._count += 1
+            self._rate_sum += rate
+            self._rate_min = min(self._rate_min, rate)
+            self._rate_max = max(self._rate_max, rate)
+            if position == position:  # not NaN, i.e., the position was known
+                self._position_count += 1
+                self._position_sum += position
+                self._position_min = min(self._position_min, position)
+                self._position_max = max(self._position_max, position)
+        else:
+            self._moves += 1
+            self._bursts += event == EVENT_BURST
+        self._window = window_min, window_max
+
+    def clear(self) -> None:
+        """Remove all buckets."""
+        self.buckets.clear()
+        self._bucket = None
+        self._reset()
+
+    def current(self) -> tuple:
+        """Get the bucket that is currently filled as a record."""
+        count, position_count = self._count, self._position_count
+        return (
+            self._bucket,
+            count,
+            self._rate_min if count else np.nan,
+            self._rate_max if count else np.nan,
+            self._rate_sum / count if count else np.nan,
+            self._position_min if position_count else np.nan,
+            self._position_max if position_count else np.nan,
+            self._position_sum / position_count if position_count else np.nan,
+            self._moves,
+            self._bursts,
+            *self._window,
+        )
+
+    def since(self, start: float) -> np.ndarray:
+        """Get the buckets from a start time on, including the current one.
+
+        :param start: Time in seconds, the bucket containing it is the first one.
+
+        :return: Buckets in time order.
+        """
+        buckets = self.buckets.since(start - start % self.resolution)
+        if self._bucket is None:
+            return buckets
+        return np.append(buckets, np.array(self.current(), dtype=AGGREGATE_DTYPE))
+
+    def _reset(self) -> None:
+        """Reset the accumulators for a new bucket."""
+        self._count = 0
+        self._rate_sum = 0.0
+        self._rate_min = np.inf
+        self._rate_max = -np.inf
+        self._position_count = 0
+        self._position_sum = 0.0
+        self._position_min = np.inf
+        self._position_max = -np.inf
+        self._moves = 0
+        self._bursts = 0
+        self._window = np.nan, np.nan
+
+
+def aggregates_to_history(aggregates: np.ndarray, resolution: float) -> np.ndarray:
+    """Convert buckets to history records, e.g., to analyze them.
+
+    Every bucket with samples becomes one sample with the mean rate and position in
+    the middle of the bucket. The movements and bursts of a bucket are spread
+    evenly over it.
+
+    :param aggregates: Buckets, see ``AGGREGATE_DTYPE``.
+    :param resolution: Duration of a bucket in seconds.
+
+    :return: Records of the history in time order.
+    """
+    moves = aggregates["moves"].astype(np.int64)
+    move_indexes = np.repeat(np.arange(aggregates.shape[0]), moves)
+    rank = np.arange(move_indexes.shape[0]) - np.repeat(np.cumsum(moves) - moves, moves)
+    move_events = np.where(
+        rank < moves[move_indexes] - aggregates["bursts"][move_indexes],
+        EVENT_MOVE,
+        EVENT_BURST,
+    )
+
+    sample_indexes = np.flatnonzero(aggregates["count"] > 0)
+    indexes = np.concatenate((sample_indexes, move_indexes))
+    events = np.concatenate(
+        (np.full(sample_indexes.shape[0], EVENT_SAMPLE), move_events)
+    )
+    fractions = np.concatenate(
+        (np.full(sample_indexes.shape[0], 0.5), (rank + 0.5) / moves[move_indexes])
+    )
+    times = aggregates["time"][indexes] + fractions * resolution
+    order = np.argsort(times, kind="stable")
+    indexes, events, times = indexes[order], events[order], times[order]
+
+    records = np.zeros(indexes.shape[0], dtype=HISTORY_DTYPE)
+    records["time"] = times
+    records["event"] = events
+    records["rate"] = np.where(
+        events == EVENT_SAMPLE, aggregates["rate_mean"][indexes], np.nan
+    )
+    records["position"] = aggregates["position_mean"][indexes]
+    records["window_min"] = aggregates["window_min"][indexes]
+    records["window_max"] = aggregates["window_max"][indexes]
+    return records
+
+
+class RetentionStore:
+    """History of a session with full resolution for recent records only.
+
+    The store is a drop-in for ``history.SessionHistory`` in the GUI: records are
+    appended the same way, and ``records`` returns the history in the same format,
+    at the finest resolution that still covers the requested time span.
+
+    :param raw_capacity: Number of records kept at full resolution.
+    :param tiers: Resolution in seconds and number of buckets of each tier, from
+        fine to coarse.
+    """
+
+    def __init__(
+        self,
+        raw_capacity: int = 2**20,
+        tiers: Sequence[Tuple[float, int]] = DEFAULT_TIERS,
+    ):
+        self.raw = RingBuffer(raw_capacity, HISTORY_DTYPE)
+        self.tiers = [AggregateTier(resolution, size) for resolution, size in tiers]
+        self._first_time = None  # time of the first record since the last clear
+        self._num_records = 0
+
+    def __len__(self) -> int:
+        """Get the number of records appended since the last clear."""
+        return self._num_records
+
+    def append(
+        self,
+        timestamp: float,
+        event: int,
+        rate: float,
+        position: float,
+        window_min: float,
+        window_max: float,
+    ) -> None:
+        """Append a record to the raw buffer and to all tiers.
+
+        See ``history.SessionHistory.append`` for the parameters.
+        """
+        record = timestamp, event, rate, position, window_min, window_max
+        self.raw.append(record)
+        for tier in self.tiers:
+            tier.add(*record)
+        if self._first_time is None:
+            self._first_time = timestamp
+        self._num_records += 1
+
+    def clear(self) -> None:
+        """Remove all records."""
+        self.raw.clear()
+        for tier in self.tiers:
+            tier.clear()
+        self._first_time = None
+        self._num_records = 0
+
+    def since(self, start: float) -> np.ndarray:
+        """Get the raw records from a start time on, as far as they are kept.
+
+        :param start: Unix time in seconds.
+
+        :return: Records of the history.
+        """
+        return self.raw.since(start)
+
+    def query(
+        self, start: float = None, max_points: int = None
+    ) -> Tuple[float, np.ndarray]:
+        """Get the records from a start time on from the best matching tier.
+
+        The finest tier that covers the start time and returns at most
+        ``max_points`` records is used. If no tier covers the start time, the
+        coarsest one is used.
+
+        :param start: Unix time in seconds, the whole session if not given.
+        :param max_points: Maximum number of records, e.g., for a plot.
+
+        :return: Resolution in seconds (0 for raw records), records. Raw records
+            are ``history.HISTORY_DTYPE``, buckets are ``AGGREGATE_DTYPE``.
+        """
+        if self._first_time is None:
+            return 0.0, np.zeros(0, dtype=HISTORY_DTYPE)
+        start = self._first_time if start is None else max(start, self._first_time)
+
+        candidates = [(0.0, self.raw, self.raw.since)] + [
+            (tier.resolution, tier.buckets, tier.since) for tier in self.tiers
+        ]
+        for resolution, buffer, since in candidates:
+            if buffer.is_full and buffer.oldest_time > start:
+                continue  # does not cover the start anymore
+            records = since(start)
+            if max_points is None or records.shape[0] <= max_points:
+                return resolution, records
+
+        coarsest = self.tiers[-1]
+        return coarsest.resolution, coarsest.since(start)
+
+    def records(self, start: float = None, max_points: int = None) -> np.ndarray:
+        """Get the history from a start time on in the format of a session history.
+
+        Buckets are converted with ``aggregates_to_history``.
+
+        :param start: Unix time in seconds, the whole session if not given.
+        :param max_points: Maximum number of buckets, e.g., for a plot.
+
+        :return: Records of the history, see ``history.HISTORY_DTYPE``.
+        """
+        resolution, records = self.query(start, max_points)
+        if resolution == 0:
+            return records
+        return aggregates_to_history(records, resolution)
+
+    def save(self, fname: Path) -> None:
+        """Save the history of the whole session to a ``.npy`` file.
+
+        :param fname: File to save to.
+        """
+        np.save(fname, self.records())
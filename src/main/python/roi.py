@@ -0,0 +1,164 @@
+"""Count rates in multiple time-of-flight regions of interest (ROIs).
+
+The ROIs are defined as time-of-flight windows in the configuration of this program
+and are evaluated on the spectrum that is read from the TDC. This way, the laser
+can be regulated on a given peak without having to reconfigure the MCS8a.
+"""
+
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+
+class RoiWindow(NamedTuple):
+    """Named time-of-flight window, limits are given in microseconds."""
+
+    name: str
+    tof_min: float
+    tof_max: float
+
+
+def parse_roi_windows(value: str) -> List[RoiWindow]:
+    """Parse the ROI windows from a configuration string.
+
+    The string is a semicolon separated list of ``name: min-max`` entries, where the
+    minimum and maximum time of flight are given in microseconds, e.g.,
+    ``"Ti: 12.1-12.4; Fe: 14.0-14.3"``.
+
+    :param value: Configuration string to parse.
+
+    :return: List of ROI windows.
+
+    :raises ValueError: The string is malformed or a window is invalid.
+    """
+    windows = []
+    for entry in value.split(";"):
+        if entry.strip() == "":
+            continue
+
+        name, sep, limits = entry.partition(":")
+        name = name.strip()
+        tof_limits = limits.split("-")
+        if sep == "" or name == "" or len(tof_limits) != 2:
+            raise ValueError(f"Invalid ROI definition: {entry.strip()}")
+
+        tof_min, tof_max = (float(it) for it in tof_limits)
+        if tof_min < 0 or tof_max <= tof_min:
+            raise ValueError(f"Invalid time of flight window for ROI {name}.")
+        if name in (window.name for window in windows):
+            raise ValueError(f"ROI {name} is defined more than once.")
+
+        windows.append(RoiWindow(name, tof_min, tof_max))
+
+    return windows
+
+
+class MultiRoiRate:
+    """Calculate sums and rates of several ROIs from a spectrum.
+
+    All ROI sums are calculated in one vectorized pass over the spectrum using its
+    prefix sum. Rates are calculated incrementally from the difference of the sums
+    and of the runtime with respect to the previous read.
+    """
+
+    def __init__(self, windows: List[RoiWindow], bin_width: float):
+        """Initialize the multi ROI rate calculator.
+
+        :param windows: ROI windows to evaluate.
+        :param bin_width: Width of one spectrum bin in microseconds.
+        """
+        self.windows = windows
+        self.bin_width = bin_width
+
+        self._names = [window.name for window in windows]
+        self._bin_min = np.array(
+            [np.floor(window.tof_min / bin_width) for window in windows], dtype=np.int64
+        )
+        self._bin_max = np.array(
+            [np.ceil(window.tof_max / bin_width) for window in windows], dtype=np.int64
+        )
+
+        self._prefix = np.zeros(1, dtype=np.uint64)  # re-used prefix sum buffer
+
+        self._last_sums = None
+        self._last_runtime = None
+        self._rates = np.zeros(len(windows))
+
+    @property
+    def bin_range(self) -> Tuple[int, int]:
+        """Get the first bin and the bin after the last one of all ROIs."""
+        if len(self.windows) == 0:
+            return 0, 0
+        return max(0, int(self._bin_min.min())), max(0, int(self._bin_max.max()))
+
+    @property
+    def names(self) -> List[str]:
+        """Get the names of all ROIs."""
+        return self._names
+
+    @property
+    def rates(self) -> Dict[str, float]:
+        """Get the rates of the last update in counts per second, by ROI name."""
+        return dict(zip(self._names, self._rates.tolist()))
+
+    @property
+    def sums(self) -> Dict[str, int]:
+        """Get the sums of the last update, by ROI name."""
+        if self._last_sums is None:
+            return dict.fromkeys(self._names, 0)
+        return dict(zip(self._names, self._last_sums.tolist()))
+
+    def rate(self, name: str) -> float:
+        """Get the rate of a given ROI from the last update.
+
+        :param name: Name of the ROI.
+
+        :return: Count rate in counts per second.
+        """
+        return self._rates[self._names.index(name)]
+
+    def reset(self) -> None:
+        """Forget the previous read, the next update starts a new integration."""
+        self._last_sums = None
+        self._last_runtime = None
+        self._rates[:] = 0
+
+    def update(
+        self, spectrum: np.ndarray, runtime: float, offset: int = 0
+    ) -> Dict[str, float]:
+        """Update the ROI sums and rates with a new spectrum.
+
+        If the acquisition was restarted since the last read, i.e., the runtime or any
+        of the sums decreased, the rates are calculated from the start of the
+        acquisition.
+
+        :param spectrum: Spectrum as read from the TDC, or the bins of ``bin_range``.
+        :param runtime: Runtime of the acquisition in seconds.
+        :param offset: Bin of the spectrum the given counts start at.
+
+        :return: Rates of all ROIs in counts per second, by ROI name.
+        """
+        num_bins = spectrum.shape[0]
+        if self._prefix.shape[0] != num_bins + 1:
+            self._prefix = np.zeros(num_bins + 1, dtype=np.uint64)
+        np.cumsum(spectrum, dtype=np.uint64, out=self._prefix[1:])
+
+        sums = (
+            self._prefix[np.clip(self._bin_max - offset, 0, num_bins)]
+            - self._prefix[np.clip(self._bin_min - offset, 0, num_bins)]
+        )
+
+        restarted = (
+            self._last_runtime is None
+            or runtime < self._last_runtime
+            or np.any(sums < self._last_sums)
+        )
+        if restarted:
+            if runtime > 0:
+                self._rates = sums / runtime
+        elif (delta_t := runtime - self._last_runtime) > 0:
+            self._rates = (sums - self._last_sums) / delta_t
+
+        self._last_sums = sums
+        self._last_runtime = runtime
+        return self.rates
@@ -0,0 +1,273 @@
+"""Continuous angle scan to map the count rate versus the stage angle.
+
+The stage sweeps in one continuous move from the lower to the upper limit of the
+laser profile, while the TDC is sampled on the fly. Stage positions and TDC samples
+are time stamped and interpolated onto one count rate versus angle curve.
+TDC samples are time stamped when the TDC was read, not when the sample was
+processed, since a constant lag would shift the curves of the two directions
+against each other.
+A bidirectional scan sweeps back down again, the shift between the two curves is
+the backlash of the stage.
+"""
+
+import time
+from typing import Tuple, Union
+
+import numpy as np
+from PyQt6 import QtCore
+
+from mcs8a import FakeMCS8aComm, MCS8aComm
+from power_control import MotionProfile
+from roi import MultiRoiRate
+from workers import StagePriority, StageThread
+
+# largest plausible backlash in regulation steps, larger estimates are rejected
+BACKLASH_MAX_STEPS = 5
+
+
+def scan_curve(
+    sample_times: np.ndarray,
+    runtimes: np.ndarray,
+    counts: np.ndarray,
+    position_times: np.ndarray,
+    positions: np.ndarray,
+    resolution: float = 0.5,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Interpolate time stamped TDC samples onto a count rate versus angle curve.
+
+    The rate between two consecutive TDC samples is assigned to the angle the stage
+    had in the middle of the two samples. The rates are then averaged in angle bins.
+
+    :param sample_times: Times the TDC samples were read in seconds.
+    :param runtimes: Acquisition runtimes of the TDC samples in seconds.
+    :param counts: Counts in the ROI of the TDC samples.
+    :param position_times: Time stamps of the stage positions in seconds.
+    :param positions: Stage positions in degrees.
+    :param resolution: Width of the angle bins in degrees.
+
+    :return: Angles of the bin centers in degrees, count rates in counts per second.
+        Bins without samples are omitted.
+    """
+    delta_runtime = np.diff(runtimes)
+    valid = delta_runtime > 0
+    rates = np.diff(counts)[valid] / delta_runtime[valid]
+    mid_times = 0.5 * (sample_times[1:] + sample_times[:-1])[valid]
+
+    # only use samples that were taken while the stage was sweeping
+    sweeping = (mid_times >= position_times[0]) & (mid_times <= position_times[-1])
+    angles = np.interp(mid_times[sweeping], position_times, positions)
+    rates = rates[sweeping]
+
+    angle_min = positions.min()
+    num_bins = max(1, int(np.ceil((positions.max() - angle_min) / resolution)))
+    bins = np.clip(((angles - angle_min) / resolution).astype(int), 0, num_bins - 1)
+
+    bin_counts = np.bincount(bins, minlength=num_bins)
+    bin_sums = np.bincount(bins, weights=rates, minlength=num_bins)
+    filled = bin_counts > 0
+
+    bin_centers = angle_min + (np.arange(num_bins) + 0.5) * resolution
+    return bin_centers[filled], bin_sums[filled] / bin_counts[filled]
+
+
+def estimate_backlash(
+    angles_up: np.ndarray,
+    rates_up: np.ndarray,
+    angles_down: np.ndarray,
+    rates_down: np.ndarray,
+    max_shift: float = 2.0,
+    step: float = 0.005,
+) -> float:
+    """Estimate the backlash from the curves of a sweep up and a sweep down.
+
+    Moving up, the half-wave plate lags behind the motor by half the backlash,
+    moving down, it leads by half the backlash. The curve of the down sweep is thus
+    the curve of the up sweep shifted by the backlash: ``down(a) = up(a + b)``.
+    All shifts are compared at once and the one with the smallest mean squared
+    difference is returned.
+
+    :param angles_up: Angles of the sweep up in degrees.
+    :param rates_up: Count rates of the sweep up in counts per second.
+    :param angles_down: Angles of the sweep down in degrees.
+    :param rates_down: Count rates of the sweep down in counts per second.
+    :param max_shift: Largest backlash to consider in degrees.
+    :param step: Resolution of the estimate in degrees.
+
+    :return: Backlash in degrees, NaN if the curves do not overlap enough.
+    """
+    shifts = np.arange(0, max_shift + step / 2, step)
+    shifted = np.interp(
+        angles_down[np.newaxis, :] + shifts[:, np.newaxis],
+        angles_up,
+        rates_up,
+        left=np.nan,
+        right=np.nan,
+    )
+    squares = (shifted - rates_down) ** 2
+    overlap = np.count_nonzero(~np.isnan(squares), axis=1)
+    valid = overlap >= max(2, angles_down.shape[0] // 2)
+    if not np.any(valid):
+        return np.nan
+    errors = np.full(shifts.shape[0], np.inf)
+    errors[valid] = np.nanmean(squares[valid], axis=1)
+    return float(shifts[np.argmin(errors)])
+
+
+class AngleScan(QtCore.QObject):
+    """Sweep the stage once between two angles and record the count rate.
+
+    The sweep runs on the stage thread, while the TDC is sampled with a timer on the
+    thread this object lives in. When done, ``finished`` emits the angles and rates
+    as numpy arrays, see ``scan_curve``. For a bidirectional scan, these are the
+    ones of the sweep up and ``backlash`` is estimated from the sweep down.
+    Estimates larger than ``max_backlash`` are rejected, ``backlash`` is ``None``
+    then and ``backlash_estimate`` holds the rejected estimate.
+    """
+
+    finished = QtCore.pyqtSignal(object, object)
+
+    _position_recorded = QtCore.pyqtSignal(float, float)
+    _sweep_finished = QtCore.pyqtSignal()
+
+    def __init__(
+        self,
+        stage: StageThread,
+        mcs8a: Union[MCS8aComm, FakeMCS8aComm],
+        lower: float,
+        upper: float,
+        roi_rates: MultiRoiRate = None,
+        roi_name: str = None,
+        sample_interval: float = 0.05,
+        resolution: float = 0.5,
+        bidirectional: bool = False,
+        profile: MotionProfile = None,
+        max_backlash: float = None,
+    ):
+        """Initialize the angle scan.
+
+        :param stage: Stage thread to run the sweep on.
+        :param mcs8a: Instance of MCS8a, with the active channel set.
+        :param lower: Angle to start the sweep at in degrees.
+        :param upper: Angle to end the sweep at in degrees.
+        :param roi_rates: Multi ROI rate calculator, if the rate should be taken from
+            the ROI ``roi_name`` instead of the ROI of the MCS8a software.
+        :param roi_name: Name of the ROI to record.
+        :param sample_interval: Time between two TDC samples in seconds.
+        :param resolution: Width of the angle bins in degrees.
+        :param bidirectional: Sweep back down to estimate the backlash.
+        :param profile: Motion profile of the sweeps, the default profile of the
+            stage if not given. The stage moves to the start with the default one.
+        :param max_backlash: Largest plausible backlash in degrees, no limit if not
+            given.
+        """
+        super().__init__()
+
+        self.stage = stage
+        self.mcs8a = mcs8a
+        self.lower = lower
+        self.upper = upper
+        self.roi_rates = roi_rates
+        self.roi_name = roi_name
+        self.resolution = resolution
+        self.bidirectional = bidirectional
+        self.profile = profile
+        self.max_backlash = max_backlash
+        self.backlash = None  # estimated backlash in degrees
+        self.backlash_estimate = None  # also if rejected
+
+        self._samples = []  # (time, runtime, counts)
+        self._positions = []  # (time, position)
+
+        self._sample_timer = QtCore.QTimer()
+        self._sample_timer.setInterval(int(sample_interval * 1000))
+        self._sample_timer.timeout.connect(self._sample)
+
+        self._position_recorded.connect(self._record_position)
+        self._sweep_finished.connect(self._finish)
+
+    def start(self) -> None:
+        """Start the scan."""
+        self._samples = []
+        self._positions = []
+        self.stage.submit(StagePriority.MANUAL, self._sweep, is_move=True)
+        self._sample_timer.start()
+
+    def _finish(self) -> None:
+        """Stop sampling, calculate the curve and emit it."""
+        self._sample_timer.stop()
+        self._sample()
+
+        angles, rates = self._curve(0)
+        if self.bidirectional:
+            angles_down, rates_down = self._curve(1)
+            if angles.shape[0] > 1 and angles_down.shape[0] > 1:
+                backlash = estimate_backlash(angles, rates, angles_down, rates_down)
+                if not np.isnan(backlash):
+                    self.backlash_estimate = backlash
+                    if self.max_backlash is None or backlash <= self.max_backlash:
+                        self.backlash = backlash
+        self.finished.emit(angles, rates)
+
+    def _curve(self, sweep: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Calculate the curve of one sweep.
+
+        :param sweep: Index of the sweep, 0 for up, 1 for down.
+
+        :return: Angles in degrees, count rates in counts per second.
+        """
+        if len(self._samples) < 2 or len(self._positions) < sweep + 2:
+            return np.zeros(0), np.zeros(0)
+        samples = np.array(self._samples)
+        positions = np.array(self._positions[sweep : sweep + 2])
+        return scan_curve(
+            samples[:, 0],
+            samples[:, 1],
+            samples[:, 2],
+            positions[:, 0],
+            positions[:, 1],
+            resolution=self.resolution,
+        )
+
+    def _record_position(self, timestamp: float, position: float) -> None:
+        """Store a time stamped stage position."""
+        self._positions.append((timestamp, position))
+
+    def _sample(self) -> None:
+        """Take a sample of the ROI counts, time stamped when the TDC was read."""
+        if not self.mcs8a.is_measuring:
+            return
+
+        if self.roi_rates is None:
+            runtime = self.mcs8a.acquisition_status.runtime
+            counts = self.mcs8a.acquisition_status.roisum
+        else:
+            bin_min, bin_max = self.roi_rates.bin_range
+            spectrum = self.mcs8a.spectrum_window(bin_min, bin_max)  # updates status
+            runtime = self.mcs8a.acquisition_status.runtime
+            self.roi_rates.update(spectrum, runtime, offset=bin_min)
+            counts = self.roi_rates.sums[self.roi_name]
+        timestamp = self.mcs8a.status_time
+        if self._samples and timestamp <= self._samples[-1][0]:
+            return  # same snapshot as the last sample
+        self._samples.append((timestamp, runtime, counts))
+
+    def _sweep(self) -> None:
+        """Sweep the stage, runs on the stage thread.
+
+        The stage moves to the lower angle and sweeps to the upper one, for a
+        bidirectional scan also back down to the lower one.
+
+        The stage is only time stamped at the start and the end of the sweep, since
+        its position cannot be queried while the move command is running.
+        """
+        try:
+            power = self.stage.power
+            power.move(self.lower, absolute=True)
+            self._position_recorded.emit(time.monotonic(), power.position)
+            power.move(self.upper, absolute=True, profile=self.profile)
+            self._position_recorded.emit(time.monotonic(), power.position)
+            if self.bidirectional:
+                power.move(self.lower, absolute=True, profile=self.profile)
+                self._position_recorded.emit(time.monotonic(), power.position)
+        finally:
+            self._sweep_finished.emit()
@@ -0,0 +1,132 @@
+"""Live view of the time-of-flight spectrum while it builds up.
+
+The spectrum of the TDC can have millions of bins, far more than there are pixels
+on the screen. It is therefore rebinned to about one bin per pixel. Between two
+reads, only few bins change, thus the rebinned spectrum is updated with the
+differences of the changed bins only, instead of rebinning the whole spectrum.
+"""
+
+from typing import Union
+
+import numpy as np
+from PyQt6 import QtCore, QtWidgets
+
+from acquisition import ProcessMCS8aComm
+from mcs8a import FakeMCS8aComm, MCS8aComm
+from widgets import LinePlot
+
+
+class IncrementalRebinner:
+    """Rebin a spectrum to a fixed number of bins, updated with the changed bins.
+
+    :param num_bins: Number of bins of the rebinned spectrum, at most.
+    """
+
+    def __init__(self, num_bins: int):
+        self.num_bins = max(1, num_bins)
+        self.factor = 1  # number of spectrum bins per rebinned bin
+        self.binned = np.zeros(0)
+        self._previous = None
+
+    def reset(self, num_bins: int = None) -> None:
+        """Rebin the whole spectrum with the next update.
+
+        :param num_bins: New number of bins of the rebinned spectrum.
+        """
+        if num_bins is not None:
+            self.num_bins = max(1, num_bins)
+        self._previous = None
+
+    def update(self, spectrum: np.ndarray) -> bool:
+        """Update the rebinned spectrum with a new read of the spectrum.
+
+        If the spectrum got shorter or any bin decreased, e.g., because a new
+        acquisition was started, the whole spectrum is rebinned again.
+
+        :param spectrum: Counts per bin of the spectrum.
+
+        :return: True if the rebinned spectrum changed.
+        """
+        previous = self._previous
+        if previous is None or previous.shape != spectrum.shape:
+            self._rebin(spectrum)
+            return True
+
+        changed = np.flatnonzero(spectrum != previous)
+        if changed.shape[0] == 0:
+            return False
+
+        values = spectrum[changed]  # copy, the spectrum might be updated meanwhile
+        delta = values.astype(np.int64) - previous[changed]
+        if np.any(delta < 0):
+            self._rebin(spectrum)
+            return True
+
+        self.binned += np.bincount(
+            changed // self.factor, weights=delta, minlength=self.binned.shape[0]
+        )
+        previous[changed] = values
+        return True
+
+    def _rebin(self, spectrum: np.ndarray) -> None:
+        """Rebin the whole spectrum."""
+        self._previous = np.array(spectrum, dtype=np.uint32)
+        self.factor = max(1, -(-spectrum.shape[0] // self.num_bins))
+        if spectrum.shape[0] == 0:
+            self.binned = np.zeros(0)
+            return
+        starts = np.arange(0, spectrum.shape[0], self.factor)
+        self.binned = np.add.reduceat(self._previous, starts, dtype=np.float64)
+
+
+class SpectrumView(QtWidgets.QWidget):
+    """Widget that shows the spectrum of the TDC while it builds up.
+
+    The spectrum is read with a timer, which caps the rate of the redraws. The plot
+    is only redrawn if the spectrum changed and the widget is visible.
+
+    :param mcs8a: Instance of the MCS8a, with the active channel set.
+    :param max_fps: Maximum number of redraws per second.
+    """
+
+    def __init__(
+        self,
+        mcs8a: Union[MCS8aComm, FakeMCS8aComm, ProcessMCS8aComm],
+        max_fps: float = 5.0,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.mcs8a = mcs8a
+
+        self.plot = LinePlot(xlabel="Time of flight (us)", ylabel="Counts")
+        self.rebinner = IncrementalRebinner(self.plot.width())
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.plot)
+        self.setLayout(layout)
+
+        self.timer = QtCore.QTimer()
+        self.timer.setInterval(int(1000 / max_fps))
+        self.timer.timeout.connect(self.refresh)
+
+    def hideEvent(self, event) -> None:
+        """Stop reading the spectrum while hidden."""
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def showEvent(self, event) -> None:
+        """Start reading the spectrum when shown."""
+        super().showEvent(event)
+        self.timer.start()
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Read the spectrum and redraw the plot if it changed."""
+        if self.plot.width() != self.rebinner.num_bins:
+            self.rebinner.reset(self.plot.width())
+        if not self.rebinner.update(self.mcs8a.spectrum):
+            return
+
+        factor = self.rebinner.factor
+        centers = (np.arange(self.rebinner.binned.shape[0]) + 0.5) * factor
+        self.plot.set_data(centers * self.mcs8a.bin_width, self.rebinner.binned)
@@ -0,0 +1,97 @@
+"""Reconnect failed devices automatically with bounded exponential backoff."""
+
+import time
+
+from PyQt6 import QtCore
+
+import metrics
+from workers import Worker
+
+
+class ReconnectSupervisor(QtCore.QObject):
+    """Supervise the connections to the devices and reconnect them when they fail.
+
+    Every device is registered with a connect function and a recovered function.
+    When a device fails, the connect function is run in the thread pool until it
+    succeeds. After each failed attempt, the time until the next one is doubled,
+    up to ``max_delay``. When the connect function succeeds, the recovered function
+    is called with its result on the thread of the supervisor, e.g., to replace the
+    broken device in the GUI and resume the regulation.
+
+    :param threadpool: Thread pool to run the connect functions in.
+    :param base_delay: Time before the second attempt in seconds.
+    :param max_delay: Longest time between two attempts in seconds.
+    """
+
+    # device, seconds since the failure
+    recovered = QtCore.pyqtSignal(str, float)
+    # device, number of failed attempts, seconds until the next one, error message
+    attempt_failed = QtCore.pyqtSignal(str, int, float, str)
+
+    def __init__(
+        self,
+        threadpool: QtCore.QThreadPool,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        super().__init__()
+        self.threadpool = threadpool
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._devices = {}  # name -> (connect function, recovered function)
+        self._failures = {}  # name -> (time of failure, number of attempts)
+
+    def register(self, name: str, connect, recovered) -> None:
+        """Register a device.
+
+        :param name: Name of the device.
+        :param connect: Function without arguments that connects the device and
+            returns it, runs in the thread pool. Raises an exception on failure.
+        :param recovered: Function that takes the connected device.
+        """
+        self._devices[name] = (connect, recovered)
+
+    def device_failed(self, name: str) -> None:
+        """Start reconnecting a device, unless it is already being reconnected.
+
+        :param name: Name of the device.
+        """
+        if name in self._failures:
+            return
+        self._failures[name] = (time.monotonic(), 0)
+        metrics.DEVICE_FAILURES.inc()
+        self._attempt(name)
+
+    def is_recovering(self, name: str) -> bool:
+        """Get if a device is currently being reconnected."""
+        return name in self._failures
+
+    def _attempt(self, name: str) -> None:
+        """Try to connect a device in the thread pool."""
+        if name not in self._failures:
+            return
+        connect, _ = self._devices[name]
+        worker = Worker(connect)
+        worker.signals.result.connect(lambda device: self._succeeded(name, device))
+        worker.signals.error.connect(lambda msg: self._failed(name, msg))
+        self.threadpool.start(worker)
+
+    def _failed(self, name: str, msg: str) -> None:
+        """Schedule the next attempt with the doubled delay."""
+        failed_at, attempts = self._failures[name]
+        attempts += 1
+        self._failures[name] = (failed_at, attempts)
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        self.attempt_failed.emit(name, attempts, delay, msg)
+        QtCore.QTimer.singleShot(int(delay * 1000), lambda: self._attempt(name))
+
+    def _succeeded(self, name: str, device) -> None:
+        """Hand the connected device over and report the recovery time."""
+        failed_at, _ = self._failures.pop(name)
+        _, recovered = self._devices[name]
+        recovered(device)
+
+        duration = time.monotonic() - failed_at
+        metrics.RECOVERY_SECONDS.observe(duration)
+        self.recovered.emit(name, duration)
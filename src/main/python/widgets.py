@@ -1,6 +1,7 @@
 """My own implementations of PyQt widgets, small tweaking of existing ones."""
 
-from PyQt6 import QtWidgets
+import numpy as np
+from PyQt6 import QtCore, QtGui, QtWidgets
 
 
 class LargeQSpinBox(QtWidgets.QSpinBox):
@@ -31,6 +32,27 @@ class AngleQDoubleSpinBox(QtWidgets.QDoubleSpinBox):
         self.setMaximum(360)
 
 
+class BacklashQDoubleSpinBox(QtWidgets.QDoubleSpinBox):
+    """Create a QDoubleSpinBox for small, positive angles like the backlash."""
+
+    def __init__(self, parent=None):
+        """Initialize the spin box with new settings."""
+        super().__init__(parent)
+        self.setDecimals(3)
+        self.setMinimum(0)
+        self.setMaximum(5)
+        self.setSingleStep(0.01)
+
+
+class PortQSpinBox(QtWidgets.QSpinBox):
+    """QSpinBox for a network port, zero to disable."""
+
+    def __init__(self, parent=None):
+        """Initialize the spin box with new settings."""
+        super().__init__(parent)
+        self.setMaximum(65535)
+
+
 class ReadOnlyQDoubleSpinBox(AngleQDoubleSpinBox):
     """Create a read only QDoubleSpinBox."""
 
@@ -38,3 +60,100 @@ class ReadOnlyQDoubleSpinBox(AngleQDoubleSpinBox):
         """Initialize the spin box with new settings."""
         super().__init__(parent)
         self.setEnabled(False)
+
+
+class LinePlot(QtWidgets.QWidget):
+    """Simple line plot of y versus x, drawn with a QPainter."""
+
+    def __init__(self, xlabel: str = "", ylabel: str = "", parent=None):
+        """Initialize the plot.
+
+        :param xlabel: Label of the x axis.
+        :param ylabel: Label of the y axis.
+        """
+        super().__init__(parent)
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self._x = np.zeros(0)
+        self._y = np.zeros(0)
+        self.setMinimumSize(400, 250)
+
+    def set_data(self, x: np.ndarray, y: np.ndarray) -> None:
+        """Set the data to plot and schedule a repaint.
+
+        :param x: x values.
+        :param y: y values, same length as x.
+        """
+        self._x = np.asarray(x, dtype=float)
+        self._y = np.asarray(y, dtype=float)
+        self.update()
+
+    def paintEvent(self, event: QtGui.QPaintEvent) -> None:
+        """Draw the axes and the line."""
+        painter = QtGui.QPainter(self)
+        margin = 40
+        area = QtCore.QRectF(self.rect()).adjusted(margin, 10, -10, -margin)
+        painter.drawRect(area)
+
+        if self._x.shape[0] > 1:
+            xmin, xmax = self._x.min(), self._x.max()
+            ymin, ymax = min(0.0, self._y.min()), self._y.max()
+            xspan = xmax - xmin if xmax > xmin else 1.0
+            yspan = ymax - ymin if ymax > ymin else 1.0
+
+            xs = area.left() + (self._x - xmin) / xspan * area.width()
+            ys = area.bottom() - (self._y - ymin) / yspan * area.height()
+            painter.drawPolyline(
+                QtGui.QPolygonF([QtCore.QPointF(*it) for it in zip(xs, ys)])
+            )
+
+            painter.drawText(
+                QtCore.QPointF(area.left(), area.bottom() + 15), f"{xmin:.4g}"
+            )
+            painter.drawText(
+                QtCore.QPointF(area.right() - 30, area.bottom() + 15), f"{xmax:.4g}"
+            )
+            painter.drawText(QtCore.QPointF(2, area.bottom()), f"{ymin:.4g}")
+            painter.drawText(QtCore.QPointF(2, area.top() + 10), f"{ymax:.4g}")
+
+        painter.drawText(
+            QtCore.QPointF(area.center().x() - 30, area.bottom() + 30), self.xlabel
+        )
+        painter.drawText(QtCore.QPointF(2, area.center().y()), self.ylabel)
+        painter.end()
+
+
+class CoalescingUpdater(QtCore.QObject):
+    """Coalesce frequent widget updates into at most one update per interval.
+
+    Every update is given as setter and value. Only the latest value of each setter
+    is applied when the interval has passed, such that high-rate updates never
+    queue up redundant repaints.
+
+    :param interval: Minimum time between two applied updates in milliseconds.
+    """
+
+    def __init__(self, interval: int = 50, parent=None):
+        super().__init__(parent)
+        self._pending = {}  # setter -> latest value
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.flush)
+
+    def set(self, setter, value) -> None:
+        """Schedule an update.
+
+        :param setter: Function that applies the value, e.g., ``QLabel.setText``.
+        :param value: Value to apply, replaces a pending value of the same setter.
+        """
+        self._pending[setter] = value
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Apply all pending updates now."""
+        self._timer.stop()
+        pending, self._pending = self._pending, {}
+        for setter, value in pending.items():
+            setter(value)
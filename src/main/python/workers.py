@@ -1,12 +1,19 @@
-"""PyQt runnables for threading out.
+"""PyQt runnables and threads for threading out.
 
 This QRunnable and Worker signals follow closely the great tutorial here:
 https://www.pythonguis.com/tutorials/multithreading-pyqt6-applications-qthreadpool/
 """
 
+from enum import IntEnum
+import itertools
+import queue
+import time
 
 from PyQt6 import QtCore
 
+from metrics import BURST_REACTION
+from power_control import MOTION_BURST, MOTION_FINE, PowerControl
+
 
 class WorkerSignals(QtCore.QObject):
     """Defines the signals available from a running worker thread.
@@ -14,12 +21,22 @@ class WorkerSignals(QtCore.QObject):
     Supported signals are:
 
     error: Emits the error message as a string, to display in a box.
+    connection_lost: Emits the error message when the connection to the stage broke.
+    finished: Emits a signal when the function of a worker has successfully finished.
+    result: Emits the return value of the function of a worker.
     movement_finished: Emits a signal when the movement has successfully finished.
+    position_read: Emits the current stage position in degrees.
+    offset_read: Emits the current zero offset of the stage in degrees.
 
     """
 
     error = QtCore.pyqtSignal(str)
+    connection_lost = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal()
+    result = QtCore.pyqtSignal(object)
     movement_finished = QtCore.pyqtSignal()
+    position_read = QtCore.pyqtSignal(float)
+    offset_read = QtCore.pyqtSignal(float)
 
 
 class Worker(QtCore.QRunnable):
@@ -53,7 +70,152 @@ class Worker(QtCore.QRunnable):
 
         # Retrieve args/kwargs here; and fire processing using them
         try:
-            self.fn(*self.args, **self.kwargs)
-            self.signals.movement_finished.emit()
+            result = self.fn(*self.args, **self.kwargs)
+            self.signals.result.emit(result)
+            self.signals.finished.emit()
         except Exception as err:
-            self.signals.error.emit(err.args[0])
+            self.signals.error.emit(str(err.args[0]) if err.args else repr(err))
+
+
+class StagePriority(IntEnum):
+    """Priorities of stage commands, lower values are executed first."""
+
+    BURST = 0
+    AUTO = 1
+    MANUAL = 2
+    POSITION = 3
+
+
+# motion profile of the moves of each priority
+MOTION_PROFILES = {
+    StagePriority.BURST: MOTION_BURST,
+    StagePriority.AUTO: MOTION_FINE,
+    StagePriority.MANUAL: None,  # default profile of the controller
+}
+
+
+class StageThread(QtCore.QThread):
+    """Long-lived thread that owns all communication with the rotation stage.
+
+    Commands are put into a priority queue and executed one after the other, such
+    that two commands can never access the stage at the same time. Commands with
+    the same priority are executed in the order they were submitted.
+    Results are reported via the ``signals`` of this thread, see ``WorkerSignals``.
+
+    :param power: Power control of the rotation stage. It must only be accessed
+        from this thread after the thread has been started.
+    """
+
+    def __init__(self, power: PowerControl):
+        super(StageThread, self).__init__()
+
+        self.power = power
+        self.signals = WorkerSignals()
+
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()  # keeps order within same priority
+        self._position_read_pending = False
+
+    def home(self, offset: float = None) -> None:
+        """Home the stage, optionally after writing a new zero offset.
+
+        :param offset: Zero offset to write to the stage in degrees.
+        """
+
+        def do_home():
+            if offset is not None:
+                self.power.offset = offset
+            self.power.home()
+            self._read_offset()
+
+        self.submit(StagePriority.MANUAL, do_home, is_move=True)
+
+    def move(self, val: float, absolute: bool, priority: StagePriority) -> None:
+        """Move the stage with the motion profile of the priority.
+
+        For burst decreases, the time from the request until the stage has reached
+        the new position is recorded as reaction time.
+
+        :param val: Position or step in degrees.
+        :param absolute: Absolute move or not?
+        :param priority: Priority of the move.
+        """
+        profile = MOTION_PROFILES[priority]
+        if priority != StagePriority.BURST:
+            self.submit(
+                priority,
+                self.power.move,
+                val,
+                absolute=absolute,
+                profile=profile,
+                is_move=True,
+            )
+            return
+
+        requested = time.perf_counter()
+
+        def do_burst():
+            self.power.move(val, absolute=absolute, profile=profile)
+            BURST_REACTION.observe(time.perf_counter() - requested)
+
+        self.submit(priority, do_burst, is_move=True)
+
+    def read_offset(self) -> None:
+        """Read the zero offset of the stage, emitted with ``offset_read``."""
+        self.submit(StagePriority.POSITION, self._read_offset)
+
+    def read_position(self) -> None:
+        """Read the stage position, emitted with ``position_read``.
+
+        If a read is already waiting in the queue, no further read is queued.
+        """
+        if self._position_read_pending:
+            return
+        self._position_read_pending = True
+        self.submit(StagePriority.POSITION, self._read_position)
+
+    def stop(self) -> None:
+        """Stop the thread after the currently running command has finished."""
+        self._queue.put((-1, next(self._counter), None))
+
+    def submit(
+        self, priority: StagePriority, fn, *args, is_move: bool = False, **kwargs
+    ) -> None:
+        """Submit a command to be executed on the stage thread.
+
+        :param priority: Priority of the command.
+        :param fn: Function to execute.
+        :param args: Arguments to pass to the function.
+        :param is_move: If True, the position is read after the command and
+            ``movement_finished`` is emitted.
+        :param kwargs: Keywords to pass to the function.
+        """
+        command = (fn, args, kwargs, is_move)
+        self._queue.put((priority, next(self._counter), command))
+
+    def run(self):
+        """Execute the commands in the queue until the thread is stopped."""
+        while True:
+            _, _, command = self._queue.get()
+            if command is None:
+                break
+
+            fn, args, kwargs, is_move = command
+            try:
+                fn(*args, **kwargs)
+                if is_move:
+                    self._read_position()
+                    self.signals.movement_finished.emit()
+            except OSError as err:  # serial and timeout errors: connection broke
+                self.signals.connection_lost.emit(str(err))
+            except Exception as err:
+                self.signals.error.emit(str(err.args[0]) if err.args else repr(err))
+
+    def _read_offset(self) -> None:
+        """Read the zero offset and emit it."""
+        self.signals.offset_read.emit(float(self.power.offset.magnitude))
+
+    def _read_position(self) -> None:
+        """Read the position and emit it."""
+        self._position_read_pending = False
+        self.signals.position_read.emit(float(self.power.position))
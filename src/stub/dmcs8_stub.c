@@ -0,0 +1,147 @@
+/*
+ * Stand-in for the Fastcomtec DMCS8.DLL that exports the subset of the DMCS8 API
+ * used by DesorptionLaserControl. It allows to run, profile, and debug the real
+ * ctypes code path of `MCS8aComm` on platforms where the DLL is not available.
+ *
+ * The structures mirror the layout of the DLL on Windows, i.e., `long` is 32 bit.
+ * The acquisition is always running, the ROI rate is constant, and the spectrum
+ * contains a single peak that builds up with the runtime.
+ *
+ * Build on Linux with:
+ *     gcc -shared -fPIC -O2 -o libdmcs8_stub.so dmcs8_stub.c -lm
+ * and enter the path to `libdmcs8_stub.so` as "MCS8a DLL" in the configuration.
+ */
+
+#include <math.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <string.h>
+#include <time.h>
+
+#define STUB_ROI_RATE 1000.0
+
+typedef struct {
+    uint32_t started;
+    uint32_t maxval;
+    double runtime;
+    double ofls;
+    double totalsum;
+    double roisum;
+    double roirate;
+    double sweeps;
+    double stevents;
+    uint32_t reserved[12];
+} ACQSTATUS;
+
+typedef struct {
+    int32_t range;
+    int32_t cftfak;
+    int32_t roimin;
+    int32_t roimax;
+    int32_t nregions;
+    int32_t caluse;
+    int32_t calpoints;
+    int32_t param;
+    int32_t offset;
+    int32_t xdim;
+    uint32_t bitshift;
+    int32_t active;
+    double eventpreset;
+    double dummy1;
+    double dummy2;
+    double dummy3;
+} ACQSETTING;
+
+typedef struct {
+    int32_t sweepmode;
+    int32_t prena;
+    int32_t cycles;
+    int32_t sequences;
+    int32_t syncout;
+    int32_t digio;
+    int32_t digval;
+    int32_t dac0;
+    int32_t dac1;
+    int32_t dac2;
+    int32_t dac3;
+    int32_t dac4;
+    int32_t dac5;
+    int fdac;
+    int tagbits;
+    int extclk;
+    int32_t maxchan;
+    int32_t serno;
+    int32_t ddruse;
+    int32_t active;
+    double holdafter;
+    double swpreset;
+    double fstchan;
+    double timepreset;
+} BOARDSETTING;
+
+static ACQSETTING setting = {.range = 65536, .roimin = 0, .roimax = 65536, .bitshift = 6};
+static BOARDSETTING board = {.sweepmode = 0x2280, .serno = 1234};
+static double start_time = -1.0;
+
+static double now(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+static double runtime(void) {
+    if (start_time < 0) {
+        start_time = now();
+    }
+    return now() - start_time;
+}
+
+int GetStatusData(ACQSTATUS *status, int ndisplay) {
+    double rt = runtime();
+    (void)ndisplay;
+    memset(status, 0, sizeof(ACQSTATUS));
+    status->started = 1;
+    status->runtime = rt;
+    status->roirate = STUB_ROI_RATE;
+    status->roisum = STUB_ROI_RATE * rt;
+    status->totalsum = 2.0 * STUB_ROI_RATE * rt;
+    status->sweeps = floor(rt * 1000.0);
+    status->stevents = status->sweeps;
+    return 0;
+}
+
+int GetSettingData(ACQSETTING *acq_setting, int ndisplay) {
+    (void)ndisplay;
+    *acq_setting = setting;
+    return 0;
+}
+
+int GetMCSSetting(BOARDSETTING *board_setting, int ndevice) {
+    (void)ndevice;
+    *board_setting = board;
+    return 0;
+}
+
+int LVGetDat(uint32_t *datp, int ndisplay) {
+    double rt = runtime();
+    int32_t center = setting.range / 4;
+    (void)ndisplay;
+    for (int32_t it = 0; it < setting.range; it++) {
+        double dist = (it - center) / 10.0;
+        datp[it] = (uint32_t)(rt * (0.01 + 10.0 * exp(-0.5 * dist * dist)));
+    }
+    return 0;
+}
+
+void RunCmd(int ndevice, char *cmd) {
+    (void)ndevice;
+    if (sscanf(cmd, "range=%d", &setting.range) == 1) return;
+    if (sscanf(cmd, "bitshift=%u", &setting.bitshift) == 1) return;
+    if (sscanf(cmd, "roimin=%d", &setting.roimin) == 1) return;
+    if (sscanf(cmd, "roimax=%d", &setting.roimax) == 1) return;
+    if (sscanf(cmd, "sweepmode=%x", &board.sweepmode) == 1) return;
+    if (sscanf(cmd, "prena=%x", &board.prena) == 1) return;
+    if (sscanf(cmd, "swpreset=%lf", &board.swpreset) == 1) return;
+    if (sscanf(cmd, "rtpreset=%lf", &board.timepreset) == 1) return;
+    if (sscanf(cmd, "holdafter=%lf", &board.holdafter) == 1) return;
+}